@@ -6,15 +6,18 @@ Main application entry point
 
 import asyncio
 import logging
+import mimetypes
+import sys
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 from app.utils.config import settings
+from app.utils.file_index import file_index
 from app.utils.logger import setup_logging
 
 # Setup logging
@@ -31,11 +34,22 @@ async def lifespan(app: FastAPI):
     upload_dir = Path(settings.UPLOAD_DIR)
     upload_dir.mkdir(exist_ok=True)
     
+    # Resolve once; routes read it from app.state instead of re-resolving per request
+    app.state.upload_dir = upload_dir.resolve()
+    
+    # Build the file index used by file listings
+    await asyncio.to_thread(file_index.rebuild, app.state.upload_dir)
+    
     logs_dir = Path("logs")
     logs_dir.mkdir(exist_ok=True)
     
+    # Load the system MIME type tables now rather than on the first request
+    mimetypes.init()
+    
     logger.info(f"Upload directory: {upload_dir.absolute()}")
     logger.info(f"QUIC server configured for: {settings.QUIC_HOST}:{settings.QUIC_PORT}")
+    loop_cls = type(asyncio.get_running_loop())
+    logger.info(f"Event loop: {loop_cls.__module__}.{loop_cls.__name__}")
     
     yield
     
@@ -47,7 +61,8 @@ app = FastAPI(
     title="QUIC File Transfer API",
     description="FastAPI backend for QUIC-based file transfers with real-time progress tracking",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -103,5 +118,7 @@ if __name__ == "__main__":
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.RELOAD,
-        log_level=settings.LOG_LEVEL.lower()
+        log_level=settings.LOG_LEVEL.lower(),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
     )
\ No newline at end of file
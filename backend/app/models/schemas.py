@@ -5,7 +5,7 @@ Pydantic models for QUIC File Transfer API
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from enum import Enum
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class TransferStatus(str, Enum):
@@ -30,23 +30,25 @@ class FileUploadRequest(BaseModel):
     use_parallel_streams: Optional[bool] = Field(default=True, description="Use multiple parallel streams")
     max_parallel_streams: Optional[int] = Field(default=4, ge=1, le=10, description="Maximum parallel streams")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "chunk_size": 65536,
                 "use_parallel_streams": True,
                 "max_parallel_streams": 4
             }
         }
+    )
 
 
 class MultipleFileUploadRequest(BaseModel):
     """Request model for multiple file upload"""
-    file_paths: List[str] = Field(..., min_items=1, description="List of file paths to upload")
+    file_paths: List[str] = Field(..., min_length=1, description="List of file paths to upload")
     chunk_size: Optional[int] = Field(default=64*1024, ge=1024, le=1024*1024)
     concurrent_transfers: Optional[bool] = Field(default=True, description="Transfer files concurrently")
     
-    @validator('file_paths')
+    @field_validator('file_paths')
+    @classmethod
     def validate_file_paths(cls, v):
         if not v:
             raise ValueError('At least one file path is required')
@@ -73,8 +75,8 @@ class TransferProgress(BaseModel):
     transfer_rate: Optional[float] = Field(default=None, description="Transfer rate in bytes/second")
     eta_seconds: Optional[int] = Field(default=None, description="Estimated time to completion")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "transfer_id": "transfer_123",
                 "stream_id": 1,
@@ -88,6 +90,7 @@ class TransferProgress(BaseModel):
                 "eta_seconds": 8
             }
         }
+    )
 
 
 class FileInfo(BaseModel):
@@ -98,8 +101,8 @@ class FileInfo(BaseModel):
     hash_sha256: Optional[str] = None
     upload_date: Optional[datetime] = None
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "filename": "document.pdf",
                 "size": 1048576,
@@ -108,6 +111,7 @@ class FileInfo(BaseModel):
                 "upload_date": "2024-01-15T10:30:00Z"
             }
         }
+    )
 
 
 class TransferResult(BaseModel):
@@ -122,8 +126,8 @@ class TransferResult(BaseModel):
     error_message: Optional[str] = None
     completed_at: datetime
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "transfer_id": "transfer_123",
                 "status": "completed",
@@ -136,6 +140,7 @@ class TransferResult(BaseModel):
                 "completed_at": "2024-01-15T10:30:16Z"
             }
         }
+    )
 
 
 class TransferSession(BaseModel):
@@ -153,8 +158,8 @@ class TransferSession(BaseModel):
     started_at: datetime
     estimated_completion: Optional[datetime] = None
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "session_id": "session_456",
                 "transfer_type": "upload",
@@ -176,6 +181,7 @@ class TransferSession(BaseModel):
                 "estimated_completion": "2024-01-15T10:32:00Z"
             }
         }
+    )
 
 
 # API Response Models
@@ -187,8 +193,9 @@ class APIResponse(BaseModel):
     error: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        from_attributes=True,
+        json_schema_extra={
             "example": {
                 "success": True,
                 "message": "Operation completed successfully",
@@ -197,6 +204,7 @@ class APIResponse(BaseModel):
                 "timestamp": "2024-01-15T10:30:00Z"
             }
         }
+    )
 
 
 class FileUploadResponse(APIResponse):
@@ -206,8 +214,8 @@ class FileUploadResponse(APIResponse):
         description="Contains transfer_id, session_id, and initial progress"
     )
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "success": True,
                 "message": "File upload initiated",
@@ -216,6 +224,7 @@ class FileUploadResponse(APIResponse):
                     "session_id": "session_456",
                     "filename": "document.pdf",
                     "file_size": 1048576,
+                    "content_sha256": "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
                     "chunk_size": 65536,
                     "total_chunks": 16
                 },
@@ -223,6 +232,7 @@ class FileUploadResponse(APIResponse):
                 "timestamp": "2024-01-15T10:30:00Z"
             }
         }
+    )
 
 
 class TransferListResponse(APIResponse):
@@ -242,8 +252,8 @@ class FileListResponse(APIResponse):
         description="Contains files list and pagination info"
     )
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "success": True,
                 "message": "Files retrieved successfully",
@@ -257,6 +267,7 @@ class FileListResponse(APIResponse):
                 "timestamp": "2024-01-15T10:30:00Z"
             }
         }
+    )
 
 
 # Error Models
@@ -273,8 +284,8 @@ class ErrorResponse(APIResponse):
     data: None = None
     validation_errors: Optional[List[ValidationError]] = None
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "success": False,
                 "message": "Validation failed",
@@ -289,4 +300,5 @@ class ErrorResponse(APIResponse):
                 ],
                 "timestamp": "2024-01-15T10:30:00Z"
             }
-        }
\ No newline at end of file
+        }
+    )
\ No newline at end of file
@@ -3,24 +3,155 @@ File Management API Routes
 HTTP endpoints for file operations and management
 """
 
+import asyncio
+import hashlib
 import logging
 import mimetypes
+import mmap
+import os
+import stat as stat_module
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Tuple
+from datetime import datetime, timezone
+from email.utils import formatdate
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
 
 from app.models.schemas import FileListResponse, FileInfo, APIResponse
 from app.utils.config import settings
+from app.utils.file_index import file_index
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# SHA-256 digests keyed by (inode, mtime_ns, size); stored files are immutable until deleted
+_HASH_CACHE: "OrderedDict[Tuple[int, int, int], str]" = OrderedDict()
+_HASH_CACHE_MAX_ENTRIES = 1024
+
+
+class DownloadFileResponse(FileResponse):
+    """FileResponse that streams in 1 MiB reads instead of Starlette's 64 KiB default"""
+    chunk_size = 1024 * 1024
+
+
+@lru_cache(maxsize=512)
+def _mime_type_for_suffix(suffix: str) -> Optional[str]:
+    """Guess a MIME type from a file suffix (cached; uploads share few extensions)"""
+    mime_type, _ = mimetypes.guess_type(f"file{suffix}")
+    return mime_type
+
+
+def _guess_mime_type(filename: str) -> Optional[str]:
+    """Guess a file's MIME type from its name"""
+    return _mime_type_for_suffix(os.path.splitext(filename)[1].lower())
+
+
+def _sha256_file(file_path: Path) -> str:
+    """Compute the SHA-256 hex digest of a file via a read-only memory map"""
+    with open(file_path, 'rb') as f:
+        # mmap rejects zero-length files
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha256(mm).hexdigest()
+
+
+def _stat_upload(upload_dir: Path, filename: str) -> Tuple[Path, os.stat_result]:
+    """Resolve a filename inside the (resolved) upload directory and stat it, raising HTTPException on failure"""
+    # Security check - prevent path traversal. Reject separators and dot entries
+    # without touching the filesystem, then catch symlinks escaping the directory.
+    if "/" in filename or "\\" in filename or filename in (".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    
+    file_path = upload_dir / filename
+    if not os.path.realpath(file_path).startswith(f"{upload_dir}{os.sep}"):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    if not stat_module.S_ISREG(stat.st_mode):
+        raise HTTPException(status_code=400, detail="Not a file")
+    
+    return file_path, stat
+
+
+def _etag(stat: os.stat_result) -> str:
+    """Build a strong ETag from a file's inode, mtime and size"""
+    return f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the request's If-None-Match header covers the given ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _format_size(size_bytes: int) -> str:
+    """Format a byte count for display"""
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024**2:
+        return f"{size_bytes/1024:.1f} KB"
+    elif size_bytes < 1024**3:
+        return f"{size_bytes/(1024**2):.1f} MB"
+    else:
+        return f"{size_bytes/(1024**3):.1f} GB"
+
+def _storage_totals(upload_dir: Path) -> Tuple[int, int]:
+    """Count files and total bytes in the upload directory"""
+    total_files = 0
+    total_size = 0
+    with os.scandir(upload_dir) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                total_files += 1
+                total_size += entry.stat(follow_symlinks=False).st_size
+    return total_files, total_size
+
+
+def _find_older_than(upload_dir: Path, cutoff_time: float) -> List[Tuple[str, int]]:
+    """Collect (path, size) for files last modified before cutoff_time"""
+    victims = []
+    with os.scandir(upload_dir) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False) or entry.name.startswith('.'):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime < cutoff_time:
+                victims.append((entry.path, stat.st_size))
+    return victims
+
+
+async def _cached_sha256(file_path: Path, stat: os.stat_result) -> str:
+    """Return the file's SHA-256, reusing a cached digest if the file is unchanged"""
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    file_hash = _HASH_CACHE.get(key)
+    if file_hash is not None:
+        _HASH_CACHE.move_to_end(key)
+        return file_hash
+    
+    file_hash = await asyncio.to_thread(_sha256_file, file_path)
+    _HASH_CACHE[key] = file_hash
+    if len(_HASH_CACHE) > _HASH_CACHE_MAX_ENTRIES:
+        _HASH_CACHE.popitem(last=False)
+    return file_hash
+
+
 @router.get("/list", response_model=FileListResponse)
 async def list_files(
+    request: Request,
     page: int = Query(default=1, ge=1, description="Page number"),
     page_size: int = Query(default=20, ge=1, le=100, description="Items per page"),
     search: Optional[str] = Query(default=None, description="Search filename"),
@@ -37,62 +168,32 @@ async def list_files(
     - **sort_order**: Sort order (asc, desc)
     """
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
-        
-        if not upload_dir.exists():
-            upload_dir.mkdir(exist_ok=True)
-            return FileListResponse(
-                success=True,
-                message="No files found",
-                data={
-                    "files": [],
-                    "total_count": 0,
-                    "page": page,
-                    "page_size": page_size,
-                    "total_pages": 0
-                }
-            )
-        
-        # Get all files
-        all_files = []
-        for file_path in upload_dir.iterdir():
-            if file_path.is_file() and not file_path.name.startswith('.'):
-                # Skip if search term doesn't match
-                if search and search.lower() not in file_path.name.lower():
-                    continue
-                
-                stat = file_path.stat()
-                mime_type, _ = mimetypes.guess_type(str(file_path))
-                
-                file_info = FileInfo(
-                    filename=file_path.name,
-                    size=stat.st_size,
-                    mime_type=mime_type,
-                    upload_date=datetime.fromtimestamp(stat.st_mtime)
-                )
-                all_files.append(file_info)
-        
-        # Sort files
         reverse = sort_order.lower() == "desc"
-        if sort_by == "name":
-            all_files.sort(key=lambda x: x.filename.lower(), reverse=reverse)
-        elif sort_by == "size":
-            all_files.sort(key=lambda x: x.size, reverse=reverse)
-        elif sort_by == "date":
-            all_files.sort(key=lambda x: x.upload_date or datetime.min, reverse=reverse)
         
-        # Pagination
-        total_count = len(all_files)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_files = all_files[start_idx:end_idx]
+        # Pick up files added or removed outside the routes, then filter,
+        # sort and paginate in the index rather than scanning the directory
+        await asyncio.to_thread(file_index.refresh, request.app.state.upload_dir)
+        total_count, rows = await asyncio.to_thread(
+            file_index.query, search, sort_by, reverse, page_size, (page - 1) * page_size
+        )
         total_pages = (total_count + page_size - 1) // page_size
         
-        return FileListResponse(
+        # Only build models for the files on this page
+        page_files = []
+        for name, size, mtime in rows:
+            mime_type = _guess_mime_type(name)
+            page_files.append(FileInfo(
+                filename=name,
+                size=size,
+                mime_type=mime_type,
+                upload_date=datetime.fromtimestamp(mtime, tz=timezone.utc)
+            ))
+        
+        return ORJSONResponse(FileListResponse(
             success=True,
             message=f"Found {total_count} files",
             data={
-                "files": [file.dict() for file in page_files],
+                "files": [file.model_dump(mode="json") for file in page_files],
                 "total_count": total_count,
                 "page": page,
                 "page_size": page_size,
@@ -101,7 +202,7 @@ async def list_files(
                 "sort_by": sort_by,
                 "sort_order": sort_order
             }
-        )
+        ).model_dump(mode="json"))
         
     except Exception as e:
         logger.error(f"List files error: {e}")
@@ -109,37 +210,34 @@ async def list_files(
 
 
 @router.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(request: Request, filename: str):
     """
     Download a file by filename
     
     - **filename**: Name of the file to download
     """
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
-        file_path = upload_dir / filename
-        
-        # Security check - prevent path traversal
-        if not file_path.resolve().is_relative_to(upload_dir.resolve()):
-            raise HTTPException(status_code=400, detail="Invalid file path")
-        
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
+        file_path, stat = await asyncio.to_thread(_stat_upload, request.app.state.upload_dir, filename)
         
-        if not file_path.is_file():
-            raise HTTPException(status_code=400, detail="Not a file")
+        etag = _etag(stat)
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Last-Modified": last_modified})
         
         # Get MIME type
-        mime_type, _ = mimetypes.guess_type(str(file_path))
+        mime_type = _guess_mime_type(filename)
         if not mime_type:
             mime_type = "application/octet-stream"
         
-        logger.info(f"Downloading file: {filename} ({file_path.stat().st_size} bytes)")
+        logger.info("Downloading file: %s (%d bytes)", filename, stat.st_size)
         
-        return FileResponse(
+        # Reuse our stat so the response doesn't stat the file again
+        return DownloadFileResponse(
             path=str(file_path),
             filename=filename,
-            media_type=mime_type
+            media_type=mime_type,
+            stat_result=stat,
+            headers={"ETag": etag, "Last-Modified": last_modified}
         )
         
     except HTTPException:
@@ -150,49 +248,37 @@ async def download_file(filename: str):
 
 
 @router.get("/info/{filename}", response_model=APIResponse)
-async def get_file_info(filename: str):
+async def get_file_info(request: Request, filename: str):
     """
     Get detailed information about a file
     
     - **filename**: Name of the file
     """
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
-        file_path = upload_dir / filename
+        file_path, stat = await asyncio.to_thread(_stat_upload, request.app.state.upload_dir, filename)
         
-        # Security check
-        if not file_path.resolve().is_relative_to(upload_dir.resolve()):
-            raise HTTPException(status_code=400, detail="Invalid file path")
+        etag = _etag(stat)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
+        mime_type = _guess_mime_type(filename)
         
-        stat = file_path.stat()
-        mime_type, _ = mimetypes.guess_type(str(file_path))
-        
-        # Calculate file hash (for small files only)
-        file_hash = None
-        if stat.st_size < 50 * 1024 * 1024:  # Less than 50MB
-            import hashlib
-            hasher = hashlib.sha256()
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(8192), b""):
-                    hasher.update(chunk)
-            file_hash = hasher.hexdigest()
+        # Calculate file hash off the event loop (cached per file version)
+        file_hash = await _cached_sha256(file_path, stat)
         
         file_info = FileInfo(
             filename=filename,
             size=stat.st_size,
             mime_type=mime_type,
             hash_sha256=file_hash,
-            upload_date=datetime.fromtimestamp(stat.st_mtime)
+            upload_date=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
         )
         
-        return APIResponse(
+        return ORJSONResponse(APIResponse(
             success=True,
             message="File information retrieved",
-            data=file_info.dict()
-        )
+            data=file_info.model_dump(mode="json")
+        ).model_dump(mode="json"), headers={"ETag": etag})
         
     except HTTPException:
         raise
@@ -202,27 +288,19 @@ async def get_file_info(filename: str):
 
 
 @router.delete("/delete/{filename}", response_model=APIResponse)
-async def delete_file(filename: str):
+async def delete_file(request: Request, filename: str):
     """
     Delete a file
     
     - **filename**: Name of the file to delete
     """
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
-        file_path = upload_dir / filename
-        
-        # Security check
-        if not file_path.resolve().is_relative_to(upload_dir.resolve()):
-            raise HTTPException(status_code=400, detail="Invalid file path")
-        
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        file_size = file_path.stat().st_size
-        file_path.unlink()  # Delete the file
+        file_path, stat = await asyncio.to_thread(_stat_upload, request.app.state.upload_dir, filename)
+        file_size = stat.st_size
+        await asyncio.to_thread(file_path.unlink)  # Delete the file
+        await asyncio.to_thread(file_index.remove, request.app.state.upload_dir, [filename])
         
-        logger.info(f"Deleted file: {filename} ({file_size} bytes)")
+        logger.info("Deleted file: %s (%d bytes)", filename, file_size)
         
         return APIResponse(
             success=True,
@@ -241,58 +319,42 @@ async def delete_file(filename: str):
 
 
 @router.get("/storage-info", response_model=APIResponse)
-async def get_storage_info():
+async def get_storage_info(request: Request):
     """
     Get storage usage information
     """
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
+        upload_dir = request.app.state.upload_dir
         
-        if not upload_dir.exists():
-            return APIResponse(
+        if not await asyncio.to_thread(upload_dir.exists):
+            return ORJSONResponse(APIResponse(
                 success=True,
                 message="Storage information retrieved",
                 data={
                     "total_files": 0,
                     "total_size": 0,
                     "upload_directory": str(upload_dir),
-                    "max_file_size": settings.MAX_FILE_SIZE,
+                    "max_file_size": _format_size(settings.MAX_FILE_SIZE),
+                    "max_file_size_bytes": settings.MAX_FILE_SIZE,
                     "allowed_extensions": settings.allowed_extensions_list
                 }
-            )
+            ).model_dump(mode="json"))
         
-        total_files = 0
-        total_size = 0
-        
-        for file_path in upload_dir.iterdir():
-            if file_path.is_file() and not file_path.name.startswith('.'):
-                total_files += 1
-                total_size += file_path.stat().st_size
+        total_files, total_size = await asyncio.to_thread(_storage_totals, upload_dir)
         
-        # Format sizes
-        def format_size(size_bytes):
-            if size_bytes < 1024:
-                return f"{size_bytes} B"
-            elif size_bytes < 1024**2:
-                return f"{size_bytes/1024:.1f} KB"
-            elif size_bytes < 1024**3:
-                return f"{size_bytes/(1024**2):.1f} MB"
-            else:
-                return f"{size_bytes/(1024**3):.1f} GB"
-        
-        return APIResponse(
+        return ORJSONResponse(APIResponse(
             success=True,
             message="Storage information retrieved",
             data={
                 "total_files": total_files,
                 "total_size": total_size,
-                "total_size_formatted": format_size(total_size),
-                "upload_directory": str(upload_dir.absolute()),
-                "max_file_size": settings.MAX_FILE_SIZE,
-                "max_file_size_bytes": settings.max_file_size_bytes,
+                "total_size_formatted": _format_size(total_size),
+                "upload_directory": str(upload_dir),
+                "max_file_size": _format_size(settings.MAX_FILE_SIZE),
+                "max_file_size_bytes": settings.MAX_FILE_SIZE,
                 "allowed_extensions": settings.allowed_extensions_list
             }
-        )
+        ).model_dump(mode="json"))
         
     except Exception as e:
         logger.error(f"Storage info error: {e}")
@@ -301,6 +363,7 @@ async def get_storage_info():
 
 @router.post("/cleanup", response_model=APIResponse)
 async def cleanup_old_files(
+    request: Request,
     days_old: int = Query(default=7, ge=1, description="Delete files older than X days")
 ):
     """
@@ -309,29 +372,37 @@ async def cleanup_old_files(
     - **days_old**: Delete files older than this many days (default: 7)
     """
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
+        upload_dir = request.app.state.upload_dir
         
-        if not upload_dir.exists():
+        if not await asyncio.to_thread(upload_dir.exists):
             return APIResponse(
                 success=True,
                 message="No files to clean up",
                 data={"deleted_files": 0, "freed_space": 0}
             )
         
-        import time
         cutoff_time = time.time() - (days_old * 24 * 60 * 60)
         
-        deleted_files = 0
-        freed_space = 0
+        victims = await asyncio.to_thread(_find_older_than, upload_dir, cutoff_time)
         
-        for file_path in upload_dir.iterdir():
-            if file_path.is_file() and not file_path.name.startswith('.'):
-                if file_path.stat().st_mtime < cutoff_time:
-                    file_size = file_path.stat().st_size
-                    file_path.unlink()
-                    deleted_files += 1
-                    freed_space += file_size
-                    logger.info(f"Cleaned up old file: {file_path.name}")
+        # Unlink concurrently on the thread pool
+        results = await asyncio.gather(
+            *(asyncio.to_thread(os.unlink, path) for path, _ in victims),
+            return_exceptions=True
+        )
+        
+        deleted_names = []
+        freed_space = 0
+        for (path, size), result in zip(victims, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to clean up %s: %s", path, result)
+                continue
+            deleted_names.append(os.path.basename(path))
+            freed_space += size
+        
+        deleted_files = len(deleted_names)
+        await asyncio.to_thread(file_index.remove, upload_dir, deleted_names)
+        logger.info("Cleaned up %d old files (%d bytes)", deleted_files, freed_space)
         
         return APIResponse(
             success=True,
@@ -3,49 +3,187 @@ File Transfer API Routes
 HTTP endpoints for QUIC file transfer operations
 """
 
+import asyncio
+import hashlib
 import logging
+import os
+import tempfile
+import time
+from array import array
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Set, Tuple
 
+import orjson
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app.models.schemas import (
     FileUploadRequest, FileUploadResponse, TransferStatusResponse,
     TransferListResponse, APIResponse, TransferCancelRequest,
-    TransferProgress, TransferResult
+    TransferProgress, TransferResult, TransferStatus
 )
+from app.services.quic_service import quic_service, select_chunk_size, AUTO_CHUNK_SIZE
 from app.services.simple_quic import simple_quic_service
 from app.utils.config import settings
+from app.utils.file_index import file_index
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Read size when streaming uploaded files to disk
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# Uploads still held in memory up to this size are saved inline; a worker
+# thread hop costs more than writing them
+INLINE_SAVE_MAX = 64 * 1024
+
+# Upload limits, resolved once from settings instead of per request
+_ALLOWED_EXTS = frozenset(ext.lower() for ext in settings.allowed_extensions_list)
+_MAX_BYTES = settings.MAX_FILE_SIZE
+
+# Seconds between SSE keepalive comments when a transfer reports no progress
+SSE_KEEPALIVE_INTERVAL = 15.0
+# Seconds between status checks while an SSE stream waits; failures and
+# cancellations don't report progress, so they are only seen by polling
+SSE_STATUS_INTERVAL = 1.0
+
+# Statuses after which a transfer reports no more progress
+_TERMINAL_STATUSES = frozenset({TransferStatus.COMPLETED, TransferStatus.FAILED, TransferStatus.CANCELLED})
+
+class ProgressTable:
+    """
+    Chunk counters for live progress, stored as parallel arrays
+    
+    Each transfer gets a slot index on first update; afterwards an update is
+    just two integer stores, with no per-update dict allocation.
+    """
+    
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.sent = array('Q')
+        self.total = array('Q')
+        # Per-transfer events set on each update, for streaming subscribers
+        self.waiters: Dict[str, Set[asyncio.Event]] = {}
+    
+    def __contains__(self, transfer_id: str) -> bool:
+        return transfer_id in self.ids
+    
+    def update(self, transfer_id: str, chunks_sent: int, total_chunks: int) -> None:
+        i = self.ids.get(transfer_id)
+        if i is None:
+            self.ids[transfer_id] = len(self.sent)
+            self.sent.append(chunks_sent)
+            self.total.append(total_chunks)
+        else:
+            self.sent[i] = chunks_sent
+            self.total[i] = total_chunks
+        
+        waiters = self.waiters.get(transfer_id)
+        if waiters:
+            for event in waiters:
+                event.set()
+    
+    def subscribe(self, transfer_id: str) -> asyncio.Event:
+        """Register for update notifications on a transfer"""
+        event = asyncio.Event()
+        self.waiters.setdefault(transfer_id, set()).add(event)
+        return event
+    
+    def unsubscribe(self, transfer_id: str, event: asyncio.Event) -> None:
+        waiters = self.waiters.get(transfer_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del self.waiters[transfer_id]
+    
+    def snapshot(self, transfer_id: str) -> dict:
+        """Build the live progress payload for a transfer"""
+        i = self.ids[transfer_id]
+        chunks_sent = self.sent[i]
+        total_chunks = self.total[i]
+        return {
+            "chunks_sent": chunks_sent,
+            "total_chunks": total_chunks,
+            "progress_percentage": (chunks_sent / total_chunks * 100) if total_chunks > 0 else 0
+        }
+
 # Global progress storage for real-time updates
-active_progress: dict = {}
+active_progress = ProgressTable()
 
-def progress_callback(transfer_id: str, chunks_sent: int, total_chunks: int):
-    """Store progress updates for real-time access"""
-    progress_percentage = (chunks_sent / total_chunks * 100) if total_chunks > 0 else 0
-    active_progress[transfer_id] = {
-        "chunks_sent": chunks_sent,
-        "total_chunks": total_chunks,
-        "progress_percentage": progress_percentage
-    }
+# Progress callback handed to the transfer services; the bound method is
+# called directly per report, with no wrapper frame in between
+_store_progress = active_progress.update
+
+def _write_spool(src: BinaryIO, dst: BinaryIO) -> Tuple[int, str]:
+    """
+    Copy an upload's spooled temporary file into dst, hashing it on the way
+    
+    Each block is hashed as it is written, so the upload is read only once
+    whether the spool is in memory or on disk. Returns
+    (bytes written, SHA-256 hex digest).
+    """
+    hasher = hashlib.sha256()
+    total = 0
+    while chunk := src.read(UPLOAD_READ_SIZE):
+        hasher.update(chunk)
+        dst.write(chunk)
+        total += len(chunk)
+    return total, hasher.hexdigest()
+
+def _copy_upload(src: BinaryIO, dest: Path) -> Tuple[int, str]:
+    """
+    Save an upload to dest, enforcing MAX_FILE_SIZE
+    
+    The data goes into a hidden temporary file in the upload directory that is
+    renamed over dest once complete, so concurrent uploads of the same name
+    never interleave and a failed upload leaves any existing file untouched.
+    Returns (bytes written, SHA-256 hex digest).
+    """
+    src.seek(0, os.SEEK_END)
+    size = src.tell()
+    src.seek(0)
+    if size > _MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {_MAX_BYTES} bytes"
+        )
+    
+    tmp = tempfile.NamedTemporaryFile(dir=dest.parent, prefix=".upload-", suffix=dest.suffix, delete=False)
+    try:
+        with tmp:
+            result = _write_spool(src, tmp)
+        # NamedTemporaryFile creates 0600; match a normally created upload
+        os.chmod(tmp.name, 0o644)
+        os.replace(tmp.name, dest)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return result
+
+def _is_small(file: UploadFile) -> bool:
+    """Whether an upload is small enough to save inline; such uploads are
+    always still in memory, far below Starlette's spool rollover size"""
+    return file.size is not None and file.size <= INLINE_SAVE_MAX
+
+async def _save_upload(file: UploadFile, dest: Path) -> Tuple[int, str]:
+    """Save an uploaded file to dest, off the event loop unless it is small; returns (bytes written, hex digest)"""
+    if _is_small(file):
+        return _copy_upload(file.file, dest)
+    return await asyncio.to_thread(_copy_upload, file.file, dest)
 
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    chunk_size: Optional[int] = Form(default=1024),  # Smaller default chunk size
+    chunk_size: Optional[int] = Form(default=AUTO_CHUNK_SIZE),
     use_parallel_streams: Optional[bool] = Form(default=True)
 ):
     """
     Upload a file via QUIC protocol
     
     - **file**: File to upload
-    - **chunk_size**: Size of each chunk in bytes (default: 64KB)
+    - **chunk_size**: Size of each chunk in bytes (default: picked from file size, 64KB-1MB)
     - **use_parallel_streams**: Whether to use parallel streams
     """
     try:
@@ -55,7 +193,7 @@ async def upload_file(
         
         # Check file extension
         file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in settings.allowed_extensions_list:
+        if file_ext not in _ALLOWED_EXTS:
             raise HTTPException(
                 status_code=400, 
                 detail=f"File type {file_ext} not allowed. Allowed: {settings.allowed_extensions_list}"
@@ -67,35 +205,21 @@ async def upload_file(
         
         temp_file_path = upload_dir / file.filename
         
-        # Read and save file content
-        content = await file.read()
-        content_size = len(content)
-        
-        # Check file size
-        if content_size > settings.max_file_size_bytes:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE}"
-            )
-        
-        with open(temp_file_path, "wb") as f:
-            f.write(content)
-        
-        # Verify written file size
-        written_size = temp_file_path.stat().st_size
-        logger.info(f"Saved uploaded file: {temp_file_path}")
-        logger.info(f"Content size: {content_size} bytes, Written size: {written_size} bytes")
-        
-        if content_size != written_size:
-            logger.warning(f"Size mismatch: content={content_size}, written={written_size}")
+        # Copy file content to disk (raises 413 past MAX_FILE_SIZE)
+        written_size, content_sha256 = await _save_upload(file, temp_file_path)
+        await asyncio.to_thread(file_index.upsert, temp_file_path)
+        logger.info(f"Saved uploaded file: {temp_file_path} ({written_size} bytes)")
         
-        # Calculate total chunks based on actual file size
+        # Pick the chunk size and count from the actual file size
+        chunk_size = select_chunk_size(written_size, chunk_size)
         actual_chunks = (written_size + chunk_size - 1) // chunk_size
         
         # Start QUIC transfer
         transfer_id = await simple_quic_service.upload_file_simple(
             file_path=temp_file_path,
-            progress_callback=lambda tid, cs, tc: progress_callback(tid, cs, tc)
+            progress_callback=_store_progress,
+            content_sha256=content_sha256,
+            chunk_size=chunk_size
         )
         
         return FileUploadResponse(
@@ -105,6 +229,7 @@ async def upload_file(
                 "transfer_id": transfer_id,
                 "filename": file.filename,
                 "file_size": written_size,
+                "content_sha256": content_sha256,
                 "chunk_size": chunk_size,
                 "total_chunks": actual_chunks,
                 "use_parallel_streams": use_parallel_streams
@@ -215,14 +340,14 @@ async def cancel_transfer(request: TransferCancelRequest):
 @router.post("/upload-multiple")
 async def upload_multiple_files(
     files: List[UploadFile] = File(...),
-    chunk_size: Optional[int] = Form(default=64*1024),
+    chunk_size: Optional[int] = Form(default=AUTO_CHUNK_SIZE),
     concurrent_transfers: Optional[bool] = Form(default=True)
 ):
     """
     Upload multiple files concurrently
     
     - **files**: List of files to upload
-    - **chunk_size**: Size of each chunk in bytes
+    - **chunk_size**: Size of each chunk in bytes (default: picked per file from its size)
     - **concurrent_transfers**: Whether to transfer files concurrently
     """
     try:
@@ -235,42 +360,54 @@ async def upload_multiple_files(
         upload_dir = Path(settings.UPLOAD_DIR)
         upload_dir.mkdir(exist_ok=True)
         
-        transfer_ids = []
+        # Bound how many files are saved and handed to QUIC at once
+        sem = asyncio.Semaphore(settings.MAX_CONCURRENT_UPLOADS if concurrent_transfers else 1)
         
-        for file in files:
+        async def ingest(file: UploadFile) -> Optional[dict]:
             if not file.filename:
-                continue
+                return None
                 
             # Validate file extension
             file_ext = Path(file.filename).suffix.lower()
-            if file_ext not in settings.allowed_extensions_list:
+            if file_ext not in _ALLOWED_EXTS:
                 logger.warning(f"Skipping file {file.filename}: invalid extension {file_ext}")
-                continue
-            
-            # Save file temporarily
-            temp_file_path = upload_dir / file.filename
-            content = await file.read()
-            
-            # Check file size
-            if len(content) > settings.max_file_size_bytes:
-                logger.warning(f"Skipping file {file.filename}: too large ({len(content)} bytes)")
-                continue
-            
-            with open(temp_file_path, "wb") as f:
-                f.write(content)
+                return None
             
-            # Start transfer
-            transfer_id = await quic_service.upload_file(
-                file_path=temp_file_path,
-                chunk_size=chunk_size,
-                progress_callback=lambda tid, cs, tc: progress_callback(tid, cs, tc)
-            )
+            async with sem:
+                # Save file temporarily
+                temp_file_path = upload_dir / file.filename
+                try:
+                    file_size, content_sha256 = await _save_upload(file, temp_file_path)
+                except HTTPException as e:
+                    if e.status_code != 413:
+                        raise
+                    logger.warning(f"Skipping file {file.filename}: too large")
+                    return None
+                await asyncio.to_thread(file_index.upsert, temp_file_path)
+                
+                # Start transfer
+                transfer_id = await quic_service.upload_file(
+                    file_path=temp_file_path,
+                    chunk_size=chunk_size,
+                    progress_callback=_store_progress,
+                    content_sha256=content_sha256
+                )
             
-            transfer_ids.append({
+            return {
                 "filename": file.filename,
                 "transfer_id": transfer_id,
-                "file_size": len(content)
-            })
+                "file_size": file_size,
+                "content_sha256": content_sha256
+            }
+        
+        results = await asyncio.gather(*(ingest(file) for file in files), return_exceptions=True)
+        
+        transfer_ids = []
+        for file, result in zip(files, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to start transfer for {file.filename}: {result}")
+            elif result is not None:
+                transfer_ids.append(result)
         
         return APIResponse(
             success=True,
@@ -301,7 +438,7 @@ async def get_live_progress(transfer_id: str):
         if transfer_id in active_progress:
             return JSONResponse({
                 "transfer_id": transfer_id,
-                "live_progress": active_progress[transfer_id],
+                "live_progress": active_progress.snapshot(transfer_id),
                 "timestamp": str(datetime.utcnow())
             })
         
@@ -310,7 +447,7 @@ async def get_live_progress(transfer_id: str):
         if progress:
             return JSONResponse({
                 "transfer_id": transfer_id,
-                "progress": progress.dict(),
+                "progress": progress.model_dump(mode="json"),
                 "timestamp": str(datetime.utcnow())
             })
         
@@ -323,6 +460,71 @@ async def get_live_progress(transfer_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get live progress: {str(e)}")
 
 
+def _transfer_status(transfer_id: str) -> Optional[TransferStatus]:
+    """Status of a transfer in whichever service runs it; None once no longer tracked"""
+    transfer = simple_quic_service.active_transfers.get(transfer_id)
+    if transfer is not None:
+        return transfer["status"]
+    transfer = quic_service.active_transfers.get(transfer_id)
+    if transfer is not None:
+        return transfer.status
+    return None
+
+
+async def _progress_events(transfer_id: str) -> AsyncIterator[bytes]:
+    """Yield SSE frames for a transfer's live progress until it completes, fails, is cancelled or is dropped"""
+    event = active_progress.subscribe(transfer_id)
+    updated = True
+    last_sent = time.monotonic()
+    try:
+        while True:
+            status = _transfer_status(transfer_id)
+            if updated and transfer_id in active_progress:
+                snapshot = active_progress.snapshot(transfer_id)
+                yield b"data: " + orjson.dumps(snapshot) + b"\n\n"
+                last_sent = time.monotonic()
+                if snapshot["total_chunks"] and snapshot["chunks_sent"] >= snapshot["total_chunks"]:
+                    return
+            
+            if status is None or status in _TERMINAL_STATUSES:
+                final = {"status": status.value if status else None}
+                yield b"event: end\ndata: " + orjson.dumps(final) + b"\n\n"
+                return
+            
+            try:
+                await asyncio.wait_for(event.wait(), SSE_STATUS_INTERVAL)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_sent >= SSE_KEEPALIVE_INTERVAL:
+                    yield b": keepalive\n\n"
+                    last_sent = time.monotonic()
+            updated = event.is_set()
+            event.clear()
+    finally:
+        active_progress.unsubscribe(transfer_id, event)
+
+
+@router.get("/progress/stream/{transfer_id}")
+async def stream_live_progress(transfer_id: str):
+    """
+    Stream live progress as server-sent events
+    
+    Pushes a snapshot whenever the transfer reports progress, instead of the
+    client polling /progress/live. The stream ends once all chunks are sent,
+    or with an "end" event carrying the final status once the transfer
+    completes, fails, is cancelled or is no longer tracked.
+    
+    - **transfer_id**: ID of the transfer to monitor
+    """
+    if _transfer_status(transfer_id) is None:
+        raise HTTPException(status_code=404, detail="Transfer not found")
+    
+    return StreamingResponse(
+        _progress_events(transfer_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.delete("/cleanup")
 async def cleanup_completed_transfers():
     """
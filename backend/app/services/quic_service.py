@@ -5,18 +5,51 @@ Integrates FastAPI backend with QUIC core functionality
 
 import asyncio
 import logging
-import hashlib
+import itertools
+import sys
+import time
 import uuid
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Callable
+from typing import Deque, Dict, List, Optional, Callable
 from dataclasses import dataclass, field
 
+from aioquic.asyncio import connect
+from aioquic.quic.configuration import QuicConfiguration
+
+# Add quic_core to path
+quic_core_path = Path(__file__).parent.parent.parent.parent / "quic_core"
+sys.path.insert(0, str(quic_core_path))
+
+from client import MultiStreamQuicFileClient
+
 from app.utils.config import settings
 from app.models.schemas import TransferStatus, TransferProgress, TransferResult
 
 logger = logging.getLogger(__name__)
 
+# Minimum seconds between external progress callbacks for one transfer (~50 Hz)
+PROGRESS_REPORT_INTERVAL = 0.02
+
+# chunk_size sentinel meaning "pick from the file size"
+AUTO_CHUNK_SIZE = -1
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+
+def select_chunk_size(file_size: int, requested: Optional[int] = AUTO_CHUNK_SIZE) -> int:
+    """
+    Resolve the chunk size for a transfer
+
+    An explicit positive size from the client is kept as-is; otherwise aim for
+    about 4096 chunks per file, clamped to 64 KiB..1 MiB, so large files are
+    not split into millions of tiny frames and progress callbacks.
+    """
+    if requested is not None and requested > 0:
+        return requested
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, file_size // 4096))
+
 @dataclass
 class ActiveTransfer:
     """Track active file transfer state"""
@@ -27,12 +60,27 @@ class ActiveTransfer:
     total_chunks: int
     chunk_size: int
     status: TransferStatus = TransferStatus.PENDING
-    started_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None  # wall clock, for display/history
+    started_monotonic: float = 0.0  # for elapsed/rate math
     progress_callback: Optional[Callable] = None
     stream_ids: List[int] = field(default_factory=list)
     chunks_sent: int = 0
     bytes_transferred: int = 0
     error_message: Optional[str] = None
+    content_sha256: Optional[str] = None
+    last_report_ts: float = 0.0
+    
+    def update_progress(self, stream_id: int, chunks_sent: int, total_chunks: int) -> None:
+        """Record client chunk progress; passed to the QUIC client as its per-chunk callback"""
+        self.chunks_sent = chunks_sent
+        self.bytes_transferred = chunks_sent * self.chunk_size
+        
+        # Call external callback if provided, coalesced to PROGRESS_REPORT_INTERVAL
+        if self.progress_callback:
+            now = time.monotonic()
+            if chunks_sent == total_chunks or now - self.last_report_ts >= PROGRESS_REPORT_INTERVAL:
+                self.last_report_ts = now
+                self.progress_callback(self.transfer_id, chunks_sent, total_chunks)
 
 
 class QuicFileTransferService:
@@ -40,26 +88,18 @@ class QuicFileTransferService:
     
     def __init__(self):
         self.active_transfers: Dict[str, ActiveTransfer] = {}
-        self.transfer_history: List[TransferResult] = []
+        # Bounded so a long-running process keeps only the most recent results
+        self.transfer_history: Deque[TransferResult] = deque(maxlen=settings.HISTORY_CAP)
         self.quic_client = None
         self.quic_connection = None  # Store the context manager
         self._lock = asyncio.Lock()
+        # Held only while (re)connecting, so transfer bookkeeping under _lock
+        # never waits on a network handshake
+        self._connect_lock = asyncio.Lock()
     
     async def initialize_quic_client(self):
         """Initialize QUIC client connection"""
         try:
-            # Import QUIC client here to avoid circular imports
-            import sys
-            import os
-            
-            # Add quic_core to path
-            quic_core_path = os.path.join(os.path.dirname(__file__), '../../..', 'quic_core')
-            sys.path.append(quic_core_path)
-            
-            from client import MultiStreamQuicFileClient
-            from aioquic.asyncio import connect
-            from aioquic.quic.configuration import QuicConfiguration
-            
             configuration = QuicConfiguration(
                 alpn_protocols=["file-transfer"],
                 is_client=True,
@@ -74,21 +114,47 @@ class QuicFileTransferService:
                 create_protocol=MultiStreamQuicFileClient,
             )
             
-            # Enter the async context manager
-            self.quic_client = await self.quic_connection.__aenter__()
+            # Enter the async context manager; aioquic only gives up on an
+            # unreachable server after its idle timeout, so bound the handshake
+            self.quic_client = await asyncio.wait_for(
+                self.quic_connection.__aenter__(), settings.QUIC_CONNECT_TIMEOUT
+            )
             
             logger.info(f"QUIC client connected to {settings.QUIC_HOST}:{settings.QUIC_PORT}")
             return True
             
+        except asyncio.TimeoutError:
+            logger.error(f"Failed to initialize QUIC client: no handshake within {settings.QUIC_CONNECT_TIMEOUT}s")
         except Exception as e:
             logger.error(f"Failed to initialize QUIC client: {e}")
-            return False
+        self.quic_connection = None
+        return False
+    
+    async def get_quic_client(self):
+        """Return the shared QUIC client, connecting on first use and again
+        whenever the previous connection has closed"""
+        client = self.quic_client
+        if client and not client.connection_closed:
+            return client
+        
+        # Concurrent first uploads must share one connection, not each open
+        # their own and overwrite the others'
+        async with self._connect_lock:
+            if self.quic_client and self.quic_client.connection_closed:
+                # Typically the server's idle timeout on a cached connection
+                logger.info("QUIC connection closed, reconnecting")
+                await self._close_connection()
+            if not self.quic_client:
+                if not await self.initialize_quic_client():
+                    raise ConnectionError("Failed to connect to QUIC server")
+            return self.quic_client
     
     async def upload_file(
         self,
         file_path: Path,
-        chunk_size: int = 64 * 1024,
-        progress_callback: Optional[Callable] = None
+        chunk_size: int = AUTO_CHUNK_SIZE,
+        progress_callback: Optional[Callable] = None,
+        content_sha256: Optional[str] = None
     ) -> str:
         """Upload a file via QUIC"""
         
@@ -100,6 +166,7 @@ class QuicFileTransferService:
         
         # Calculate file info
         file_size = file_path.stat().st_size
+        chunk_size = select_chunk_size(file_size, chunk_size)
         total_chunks = (file_size + chunk_size - 1) // chunk_size
         
         # Create transfer record
@@ -111,7 +178,8 @@ class QuicFileTransferService:
             total_chunks=total_chunks,
             chunk_size=chunk_size,
             progress_callback=progress_callback,
-            started_at=datetime.utcnow()
+            started_at=datetime.utcnow(),
+            content_sha256=content_sha256
         )
         
         async with self._lock:
@@ -119,34 +187,26 @@ class QuicFileTransferService:
         
         try:
             # Ensure QUIC client is initialized
-            if not self.quic_client:
-                if not await self.initialize_quic_client():
-                    raise ConnectionError("Failed to connect to QUIC server")
+            client = await self.get_quic_client()
             
             # Update status
             transfer.status = TransferStatus.IN_PROGRESS
-            
-            # Create progress wrapper
-            def internal_progress_callback(stream_id: int, chunks_sent: int, total_chunks: int):
-                transfer.chunks_sent = chunks_sent
-                transfer.bytes_transferred = chunks_sent * chunk_size
-                
-                # Call external callback if provided
-                if progress_callback:
-                    progress_callback(transfer_id, chunks_sent, total_chunks)
+            transfer.started_monotonic = time.monotonic()
             
             # Start file transfer
-            stream_id = await self.quic_client.send_file_async(
+            stream_id = await client.send_file_async(
                 file_path,
                 chunk_size=chunk_size,
-                progress_callback=internal_progress_callback
+                progress_callback=transfer.update_progress,
+                file_hash=content_sha256,
+                file_size=file_size
             )
             
             transfer.stream_ids.append(stream_id)
             logger.info(f"Started transfer {transfer_id} on stream {stream_id}")
             
             # Wait for completion (in background)
-            asyncio.create_task(self._monitor_transfer(transfer_id, stream_id))
+            asyncio.create_task(self._monitor_transfer(transfer_id, client, stream_id))
             
             return transfer_id
             
@@ -156,15 +216,15 @@ class QuicFileTransferService:
             logger.error(f"Upload failed for {transfer_id}: {e}")
             raise
     
-    async def _monitor_transfer(self, transfer_id: str, stream_id: int):
-        """Monitor transfer completion"""
+    async def _monitor_transfer(self, transfer_id: str, client: MultiStreamQuicFileClient, stream_id: int):
+        """Monitor transfer completion on the client the stream was opened on"""
         try:
             transfer = self.active_transfers.get(transfer_id)
             if not transfer:
                 return
             
             # Wait for transfer completion
-            success = await self.quic_client.wait_for_transfer(stream_id, timeout=300)
+            success = await client.wait_for_transfer(stream_id, timeout=300)
             
             if success:
                 transfer.status = TransferStatus.COMPLETED
@@ -189,7 +249,7 @@ class QuicFileTransferService:
         async with self._lock:
             transfer = self.active_transfers.pop(transfer_id, None)
             if transfer:
-                duration = (datetime.utcnow() - transfer.started_at).total_seconds()
+                duration = time.monotonic() - transfer.started_monotonic if transfer.started_monotonic else 0
                 avg_speed = transfer.bytes_transferred / duration if duration > 0 else 0
                 
                 result = TransferResult(
@@ -215,8 +275,8 @@ class QuicFileTransferService:
         progress_percentage = (transfer.chunks_sent / transfer.total_chunks * 100) if transfer.total_chunks > 0 else 0
         
         # Calculate transfer rate
-        if transfer.started_at:
-            elapsed = (datetime.utcnow() - transfer.started_at).total_seconds()
+        if transfer.started_monotonic:
+            elapsed = time.monotonic() - transfer.started_monotonic
             transfer_rate = transfer.bytes_transferred / elapsed if elapsed > 0 else 0
             
             # Calculate ETA
@@ -226,7 +286,8 @@ class QuicFileTransferService:
             transfer_rate = None
             eta_seconds = None
         
-        return TransferProgress(
+        # Values come from internal state, so skip validation on this polled path
+        return TransferProgress.model_construct(
             transfer_id=transfer_id,
             stream_id=transfer.stream_ids[0] if transfer.stream_ids else None,
             filename=transfer.filename,
@@ -266,16 +327,25 @@ class QuicFileTransferService:
     
     async def get_transfer_history(self, limit: int = 50) -> List[TransferResult]:
         """Get transfer history"""
-        return self.transfer_history[-limit:]
+        # Walk back from the newest entry so only `limit` items are touched
+        recent = list(itertools.islice(reversed(self.transfer_history), limit))
+        recent.reverse()
+        return recent
     
-    async def cleanup(self):
-        """Cleanup resources"""
+    async def _close_connection(self):
+        """Close the shared QUIC connection, if any, and forget its client"""
         if self.quic_client and self.quic_connection:
             try:
                 # Exit the async context manager
                 await self.quic_connection.__aexit__(None, None, None)
             except Exception as e:
                 logger.error(f"Error closing QUIC connection: {e}")
+        self.quic_client = None
+        self.quic_connection = None
+    
+    async def cleanup(self):
+        """Cleanup resources"""
+        await self._close_connection()
         
         logger.info("QUIC service cleanup completed")
 
@@ -5,20 +5,15 @@ Direct integration with QUIC core for testing
 
 import asyncio
 import logging
+import time
 import uuid
-import sys
-import os
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Callable
-
-# Add quic_core to path
-current_dir = Path(__file__).parent
-quic_core_path = current_dir.parent.parent.parent / "quic_core"
-sys.path.insert(0, str(quic_core_path))
+from typing import Callable, Dict, Optional, Set
 
 from app.utils.config import settings
 from app.models.schemas import TransferStatus, TransferProgress
+from app.services.quic_service import quic_service, select_chunk_size, AUTO_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -28,34 +23,44 @@ class SimpleQuicTransferService:
     def __init__(self):
         self.active_transfers: Dict[str, dict] = {}
         self.transfer_results: Dict[str, dict] = {}
+        # IDs of transfers still in flight, so listing skips finished ones
+        self._active_ids: Set[str] = set()
     
     async def upload_file_simple(
         self, 
         file_path: Path, 
-        progress_callback: Optional[Callable] = None
+        progress_callback: Optional[Callable] = None,
+        content_sha256: Optional[str] = None,
+        chunk_size: int = AUTO_CHUNK_SIZE
     ) -> str:
         """Upload file using QUIC core directly"""
         
         transfer_id = str(uuid.uuid4())
         
         try:
-            # Import QUIC modules
-            from client import send_multiple_files
+            file_size = file_path.stat().st_size
+            chunk_size = select_chunk_size(file_size, chunk_size)
             
             # Create transfer record
             self.active_transfers[transfer_id] = {
                 "filename": file_path.name,
                 "file_path": str(file_path),
                 "status": TransferStatus.IN_PROGRESS,
-                "started_at": datetime.utcnow(),
-                "file_size": file_path.stat().st_size,
-                "progress": 0
+                "started_monotonic": time.monotonic(),
+                "file_size": file_size,
+                "chunk_size": chunk_size,
+                "chunks_sent": 0,
+                "total_chunks": (file_size + chunk_size - 1) // chunk_size,
+                "bytes_transferred": 0,
+                "progress": 0,
+                "content_sha256": content_sha256
             }
+            self._active_ids.add(transfer_id)
             
             logger.info(f"Starting QUIC transfer for {file_path.name}")
             
             # Start transfer in background
-            asyncio.create_task(self._execute_transfer(transfer_id, file_path))
+            asyncio.create_task(self._execute_transfer(transfer_id, file_path, chunk_size, progress_callback))
             
             return transfer_id
             
@@ -68,25 +73,44 @@ class SimpleQuicTransferService:
             }
             raise
     
-    async def _execute_transfer(self, transfer_id: str, file_path: Path):
+    async def _execute_transfer(
+        self,
+        transfer_id: str,
+        file_path: Path,
+        chunk_size: int,
+        progress_callback: Optional[Callable] = None
+    ):
         """Execute the actual file transfer"""
         try:
             transfer = self.active_transfers[transfer_id]
             
-            # Import the send function
-            from client import send_multiple_files
+            # Record real chunk counts from the client for progress polling
+            def on_progress(stream_id: int, chunks_sent: int, total_chunks: int):
+                transfer["chunks_sent"] = chunks_sent
+                transfer["total_chunks"] = total_chunks
+                transfer["bytes_transferred"] = min(chunks_sent * chunk_size, transfer["file_size"])
+                if progress_callback:
+                    progress_callback(transfer_id, chunks_sent, total_chunks)
+            
+            # Reuse the shared QUIC connection; each file gets its own stream
+            client = await quic_service.get_quic_client()
             
             # Execute transfer
-            success = await send_multiple_files(
-                file_paths=[str(file_path)],
-                server_host=settings.QUIC_HOST,
-                server_port=settings.QUIC_PORT
+            stream_id = await client.send_file_async(
+                file_path,
+                chunk_size=chunk_size,
+                progress_callback=on_progress,
+                file_hash=transfer["content_sha256"],
+                file_size=transfer["file_size"]
             )
+            success = await client.wait_for_transfer(stream_id, timeout=300)
             
             if success:
                 transfer["status"] = TransferStatus.COMPLETED
                 transfer["completed_at"] = datetime.utcnow()
                 transfer["progress"] = 100
+                transfer["bytes_transferred"] = transfer["file_size"]
+                transfer["elapsed"] = time.monotonic() - transfer["started_monotonic"]
                 logger.info(f"Transfer {transfer_id} completed successfully")
             else:
                 transfer["status"] = TransferStatus.FAILED
@@ -98,6 +122,8 @@ class SimpleQuicTransferService:
             transfer = self.active_transfers.get(transfer_id, {})
             transfer["status"] = TransferStatus.FAILED
             transfer["error"] = str(e)
+        finally:
+            self._active_ids.discard(transfer_id)
     
     async def get_transfer_progress(self, transfer_id: str) -> Optional[TransferProgress]:
         """Get transfer progress"""
@@ -105,37 +131,43 @@ class SimpleQuicTransferService:
         if not transfer:
             return None
         
-        # Calculate progress
+        file_size = transfer["file_size"]
         if transfer["status"] == TransferStatus.COMPLETED:
-            progress_percentage = 100.0
-            transferred_bytes = transfer["file_size"]
-        elif transfer["status"] == TransferStatus.IN_PROGRESS:
-            # For now, just estimate based on time (would be better with real progress)
-            elapsed = (datetime.utcnow() - transfer["started_at"]).total_seconds()
-            progress_percentage = min(90, elapsed * 10)  # Rough estimate
-            transferred_bytes = int(transfer["file_size"] * progress_percentage / 100)
+            transferred_bytes = file_size
+        else:
+            transferred_bytes = transfer.get("bytes_transferred", 0)
+        progress_percentage = (transferred_bytes / file_size * 100) if file_size > 0 else 0.0
+        
+        # Rate and ETA from the monotonic start time; frozen once complete
+        elapsed = transfer.get("elapsed")
+        if elapsed is None:
+            elapsed = time.monotonic() - transfer["started_monotonic"]
+        transfer_rate = transferred_bytes / elapsed if elapsed > 0 else None
+        if transfer_rate:
+            eta_seconds = int((file_size - transferred_bytes) / transfer_rate)
         else:
-            progress_percentage = 0.0
-            transferred_bytes = 0
+            eta_seconds = None
         
-        return TransferProgress(
+        # Values come from internal state, so skip validation on this polled path
+        return TransferProgress.model_construct(
             transfer_id=transfer_id,
             filename=transfer["filename"],
-            total_size=transfer["file_size"],
+            total_size=file_size,
             transferred_bytes=transferred_bytes,
-            chunks_sent=int(transferred_bytes / 65536) if transferred_bytes > 0 else 0,
-            total_chunks=int(transfer["file_size"] / 65536) + 1,
-            progress_percentage=progress_percentage
+            chunks_sent=transfer["chunks_sent"],
+            total_chunks=transfer["total_chunks"],
+            progress_percentage=progress_percentage,
+            transfer_rate=transfer_rate,
+            eta_seconds=eta_seconds
         )
     
     async def list_active_transfers(self) -> list:
         """List all active transfers"""
         result = []
-        for transfer_id, transfer in self.active_transfers.items():
-            if transfer["status"] in [TransferStatus.PENDING, TransferStatus.IN_PROGRESS]:
-                progress = await self.get_transfer_progress(transfer_id)
-                if progress:
-                    result.append(progress)
+        for transfer_id in list(self._active_ids):
+            progress = await self.get_transfer_progress(transfer_id)
+            if progress:
+                result.append(progress)
         return result
     
     async def cancel_transfer(self, transfer_id: str) -> bool:
@@ -143,6 +175,7 @@ class SimpleQuicTransferService:
         transfer = self.active_transfers.get(transfer_id)
         if transfer and transfer["status"] == TransferStatus.IN_PROGRESS:
             transfer["status"] = TransferStatus.CANCELLED
+            self._active_ids.discard(transfer_id)
             return True
         return False
 
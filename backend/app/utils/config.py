@@ -2,10 +2,16 @@
 Configuration management for FastAPI backend
 """
 
+import re
+from functools import cached_property, lru_cache
 from typing import List
 from pathlib import Path
-from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import Field, field_validator
+
+# Multipliers for MAX_FILE_SIZE unit suffixes
+_SIZE_UNITS = {None: 1, "B": 1, "KB": 1024, "MB": 1 << 20, "GB": 1 << 30}
+_SIZE_PATTERN = re.compile(r"(\d+)\s*([KMG]?B)?")
 
 
 class Settings(BaseSettings):
@@ -20,12 +26,15 @@ class Settings(BaseSettings):
     # QUIC Server Configuration
     QUIC_HOST: str = Field(default="localhost", description="QUIC server host")
     QUIC_PORT: int = Field(default=4433, description="QUIC server port")
+    QUIC_CONNECT_TIMEOUT: float = Field(default=10.0, description="Seconds to wait for the QUIC handshake")
     QUIC_CERT_PATH: str = Field(default="../quic_core/certs/cert.pem", description="QUIC SSL certificate path")
     QUIC_KEY_PATH: str = Field(default="../quic_core/certs/key.pem", description="QUIC SSL key path")
     
     # File Upload Configuration
     UPLOAD_DIR: str = Field(default="./uploads", description="Directory for uploaded files")
-    MAX_FILE_SIZE: str = Field(default="100MB", description="Maximum file size")
+    MAX_CONCURRENT_UPLOADS: int = Field(default=4, description="Files saved and transferred concurrently per batch upload")
+    MAX_FILE_SIZE: int = Field(default=100 * 1024 * 1024, description="Maximum file size in bytes; accepts KB/MB/GB suffixes")
+    HISTORY_CAP: int = Field(default=10_000, description="Maximum completed transfers kept in history")
     ALLOWED_EXTENSIONS: str = Field(
         default=".txt,.pdf,.jpg,.png,.doc,.docx,.zip,.mp4,.mp3,.json,.csv",
         description="Allowed file extensions"
@@ -48,42 +57,49 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = Field(default="INFO", description="Logging level")
     LOG_FILE: str = Field(default="./logs/backend.log", description="Log file path")
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    # Frozen so the cached_property values below can never go stale
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        frozen=True,
+        ignored_types=(cached_property,)
+    )
+    
+    @field_validator("MAX_FILE_SIZE", mode="before")
+    @classmethod
+    def parse_file_size(cls, v):
+        """Convert sizes like "100MB" to bytes once, at load time"""
+        if isinstance(v, str):
+            match = _SIZE_PATTERN.fullmatch(v.strip().upper())
+            if not match:
+                raise ValueError(f"Invalid file size: {v!r}")
+            return int(match.group(1)) * _SIZE_UNITS[match.group(2)]
+        return v
     
-    @property
+    @cached_property
     def allowed_origins_list(self) -> List[str]:
         """Convert comma-separated origins to list"""
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
     
-    @property
+    @cached_property
     def allowed_extensions_list(self) -> List[str]:
         """Convert comma-separated extensions to list"""
         return [ext.strip() for ext in self.ALLOWED_EXTENSIONS.split(",")]
     
-    @property
-    def max_file_size_bytes(self) -> int:
-        """Convert MAX_FILE_SIZE string to bytes"""
-        size_str = self.MAX_FILE_SIZE.upper()
-        if size_str.endswith('MB'):
-            return int(size_str[:-2]) * 1024 * 1024
-        elif size_str.endswith('KB'):
-            return int(size_str[:-2]) * 1024
-        elif size_str.endswith('GB'):
-            return int(size_str[:-2]) * 1024 * 1024 * 1024
-        else:
-            return int(size_str)  # Assume bytes
-    
-    @property
+    @cached_property
     def quic_cert_path_resolved(self) -> Path:
         """Resolve QUIC certificate path"""
         return Path(self.QUIC_CERT_PATH).resolve()
     
-    @property
+    @cached_property
     def quic_key_path_resolved(self) -> Path:
         """Resolve QUIC key path"""
         return Path(self.QUIC_KEY_PATH).resolve()
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings, reading the environment and .env only once"""
+    return Settings()
+
 # Global settings instance
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Index of uploaded files
+SQLite-backed filename/size/mtime metadata so listings don't rescan the upload directory
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sortable columns exposed to list_files
+SORT_COLUMNS = {
+    "name": "name_lower",
+    "size": "size",
+    "date": "mtime",
+}
+
+
+class FileIndex:
+    """In-process SQLite index of files in the upload directory"""
+
+    def __init__(self, db_path: str = ":memory:"):
+        # Routes call into the index from worker threads; a lock serializes access
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Upload directory mtime as of the last scan or indexed write; files
+        # can be added or removed there by hand, outside the routes
+        self._scanned_mtime_ns: Optional[int] = None
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    name TEXT PRIMARY KEY,
+                    name_lower TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS files_name_lower ON files (name_lower);
+                CREATE INDEX IF NOT EXISTS files_size ON files (size);
+                CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime);
+                """
+            )
+
+    def rebuild(self, upload_dir: Path) -> int:
+        """Replace the index contents with a fresh scan of the upload directory"""
+        # Taken before the scan, so a change made during it triggers another
+        dir_mtime_ns = os.stat(upload_dir).st_mtime_ns
+        rows = []
+        with os.scandir(upload_dir) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    stat = entry.stat(follow_symlinks=False)
+                    rows.append((entry.name, entry.name.lower(), stat.st_size, stat.st_mtime))
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?)", rows)
+            self._scanned_mtime_ns = dir_mtime_ns
+
+        logger.info(f"Indexed {len(rows)} files in {upload_dir}")
+        return len(rows)
+
+    def refresh(self, upload_dir: Path) -> bool:
+        """Rescan the upload directory if its mtime changed since the last scan"""
+        if os.stat(upload_dir).st_mtime_ns == self._scanned_mtime_ns:
+            return False
+        self.rebuild(upload_dir)
+        return True
+
+    def upsert(self, file_path: Path) -> None:
+        """Add or update the entry for a file just written to the upload directory
+
+        The directory mtime the write left behind is recorded too, so refresh()
+        only rescans for changes made elsewhere.
+        """
+        stat = os.stat(file_path)
+        dir_mtime_ns = os.stat(file_path.parent).st_mtime_ns
+        name = file_path.name
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (name, name.lower(), stat.st_size, stat.st_mtime)
+            )
+            self._scanned_mtime_ns = dir_mtime_ns
+
+    def remove(self, upload_dir: Path, names: Iterable[str]) -> None:
+        """Drop entries for files just deleted from the upload directory"""
+        dir_mtime_ns = os.stat(upload_dir).st_mtime_ns
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE name = ?", ((name,) for name in names))
+            self._scanned_mtime_ns = dir_mtime_ns
+
+    def query(
+        self,
+        search: Optional[str],
+        sort_by: str,
+        reverse: bool,
+        limit: int,
+        offset: int
+    ) -> Tuple[int, List[Tuple[str, int, float]]]:
+        """Return the total match count and one page of (name, size, mtime) rows"""
+        where = ""
+        params: list = []
+        if search:
+            where = "WHERE instr(name_lower, ?) > 0"
+            params.append(search.lower())
+
+        order = ""
+        column = SORT_COLUMNS.get(sort_by)
+        if column:
+            direction = "DESC" if reverse else "ASC"
+            order = f"ORDER BY {column} {direction}, name {direction}"
+
+        with self._lock:
+            total_count = self._conn.execute(f"SELECT COUNT(*) FROM files {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT name, size, mtime FROM files {where} {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return total_count, rows
+
+
+# Global index instance
+file_index = FileIndex()
@@ -2,14 +2,59 @@
 Logging configuration for FastAPI backend
 """
 
+import atexit
 import logging
 import logging.handlers
+import os
+import queue
 from pathlib import Path
 from app.utils.config import settings
 
 
+class FastRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that tracks the file size in memory
+    
+    The stock shouldRollover stats the log path and seeks the stream on every
+    record, and the record is formatted twice. Here the size is read once when
+    the file is opened and then counted per write, so an emit only formats and
+    writes unless a rollover is actually due.
+    """
+    
+    def _open(self):
+        stream = super()._open()
+        self._size = os.fstat(stream.fileno()).st_size
+        # bpo-45401: never roll over anything other than a regular file
+        self._regular = os.path.isfile(self.baseFilename)
+        # The size is counted in bytes as the stream encodes them
+        self._encoding, self._errors = stream.encoding, stream.errors
+        return stream
+    
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            # str.isascii() is O(1), so ASCII records skip the encode
+            size = len(msg) if msg.isascii() else len(msg.encode(self._encoding, self._errors))
+            if self.maxBytes > 0 and self._regular and self._size + size >= self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(msg)
+            self._size += size
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
 def setup_logging():
-    """Configure logging for the application"""
+    """Configure logging for the application; later calls are no-ops"""
+    
+    if getattr(setup_logging, "_done", False):
+        return logging.getLogger()
     
     # Create logs directory if it doesn't exist
     log_file = Path(settings.LOG_FILE)
@@ -33,21 +78,30 @@ def setup_logging():
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
     console_handler.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
-    root_logger.addHandler(console_handler)
     
     # File handler with rotation
-    file_handler = logging.handlers.RotatingFileHandler(
+    file_handler = FastRotatingFileHandler(
         log_file,
         maxBytes=10*1024*1024,  # 10MB
         backupCount=5
     )
     file_handler.setFormatter(formatter)
     file_handler.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
-    root_logger.addHandler(file_handler)
+    
+    # Callers only enqueue records; a listener thread formats and writes them,
+    # so console and file I/O never block the event loop
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
     
     # Set specific loggers
     logging.getLogger("uvicorn").setLevel(logging.INFO)
     logging.getLogger("uvicorn.access").setLevel(logging.INFO)
     logging.getLogger("fastapi").setLevel(logging.INFO)
     
+    setup_logging._done = True
     return root_logger
\ No newline at end of file
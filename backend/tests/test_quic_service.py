@@ -0,0 +1,159 @@
+"""
+Tests for the QUIC transfer service's shared client connection
+"""
+
+import asyncio
+
+import pytest
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+
+from app.services import quic_service as quic_service_module
+from app.services.quic_service import QuicFileTransferService
+from app.utils.config import settings
+
+IDLE_TIMEOUT = 1.0
+
+
+class FakeConnect:
+    """Stand-in for aioquic's connect() that hands out unconnected clients
+
+    Each client's QuicConnection has had connect() called at time 0, so its
+    idle timer is armed; tests drive it by calling handle_timer() directly.
+    """
+
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+        self.reachable = True  # False: handshakes never complete
+
+    def __call__(self, host, port, configuration, create_protocol):
+        return _FakeConnection(self, create_protocol)
+
+
+class _FakeConnection:
+    def __init__(self, owner: FakeConnect, create_protocol):
+        self.owner = owner
+        self.create_protocol = create_protocol
+
+    async def __aenter__(self):
+        # Let other tasks run mid-handshake, as a real connect() would
+        await asyncio.sleep(0)
+        if not self.owner.reachable:
+            await asyncio.Event().wait()
+        quic = QuicConnection(configuration=QuicConfiguration(
+            alpn_protocols=["file-transfer"], is_client=True, idle_timeout=IDLE_TIMEOUT))
+        client = self.create_protocol(quic)
+        quic.connect(("127.0.0.1", 4433), now=0.0)
+        self.owner.opened += 1
+        return client
+
+    async def __aexit__(self, *exc_info):
+        self.owner.closed += 1
+
+
+def expire_idle_timeout(client) -> None:
+    """Advance the client's QUIC clock past its idle timeout and deliver the events"""
+    client._quic.handle_timer(now=IDLE_TIMEOUT + 1)
+    client._process_events()
+
+
+@pytest.fixture
+def fake_connect(monkeypatch):
+    fake = FakeConnect()
+    monkeypatch.setattr(quic_service_module, "connect", fake)
+    return fake
+
+
+@pytest.fixture
+def short_connect_timeout(monkeypatch):
+    monkeypatch.setattr(quic_service_module, "settings",
+                        settings.model_copy(update={"QUIC_CONNECT_TIMEOUT": 0.1}))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_uploads_share_one_connection(fake_connect):
+    service = QuicFileTransferService()
+
+    clients = await asyncio.gather(*(service.get_quic_client() for _ in range(4)))
+    assert all(client is clients[0] for client in clients)
+    assert fake_connect.opened == 1
+
+
+@pytest.mark.asyncio
+async def test_unreachable_server_times_out_without_blocking_bookkeeping(fake_connect, short_connect_timeout):
+    fake_connect.reachable = False
+    service = QuicFileTransferService()
+
+    connecting = asyncio.ensure_future(service.get_quic_client())
+    await asyncio.sleep(0.01)
+    # Transfer bookkeeping is not held up by the pending handshake
+    await asyncio.wait_for(service._lock.acquire(), 0.05)
+    service._lock.release()
+
+    with pytest.raises(ConnectionError):
+        await connecting
+    assert service.quic_client is None
+
+
+@pytest.mark.asyncio
+async def test_client_is_reused_while_connected(fake_connect):
+    service = QuicFileTransferService()
+
+    first = await service.get_quic_client()
+    assert await service.get_quic_client() is first
+    assert fake_connect.opened == 1
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_idle_timeout(fake_connect):
+    service = QuicFileTransferService()
+    first = await service.get_quic_client()
+
+    expire_idle_timeout(first)
+    assert first.connection_closed
+
+    second = await service.get_quic_client()
+    assert second is not first
+    assert not second.connection_closed
+    assert fake_connect.opened == 2
+    assert fake_connect.closed == 1
+
+
+@pytest.mark.asyncio
+async def test_idle_timeout_fails_open_transfers(fake_connect):
+    service = QuicFileTransferService()
+    client = await service.get_quic_client()
+
+    # A transfer still waiting on the server when the connection drops
+    stream_id = client._quic.get_next_available_stream_id()
+    client.transfer_complete[stream_id] = False
+    client.transfer_events[stream_id] = asyncio.Event()
+
+    expire_idle_timeout(client)
+
+    assert not await client.wait_for_transfer(stream_id, timeout=1)
+    assert stream_id in client.transfer_errors
+
+
+@pytest.mark.asyncio
+async def test_reconnect_to_restarting_server_times_out_then_recovers(fake_connect, short_connect_timeout):
+    service = QuicFileTransferService()
+    first = await service.get_quic_client()
+
+    # The server goes away long enough for the connection to idle out
+    fake_connect.reachable = False
+    expire_idle_timeout(first)
+
+    reconnecting = asyncio.ensure_future(service.get_quic_client())
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(service._lock.acquire(), 0.05)
+    service._lock.release()
+    with pytest.raises(ConnectionError):
+        await reconnecting
+
+    # Once it is back, the next upload connects again
+    fake_connect.reachable = True
+    second = await service.get_quic_client()
+    assert second is not first
+    assert not second.connection_closed
@@ -5,18 +5,47 @@ Enhanced QUIC File Transfer Client - Multiple concurrent streams
 
 import asyncio
 import logging
-import hashlib
 import math
+import mmap
+import os
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Callable, Optional, List
 
 from aioquic.asyncio import connect
 from aioquic.asyncio.protocol import QuicConnectionProtocol
 from aioquic.quic.configuration import QuicConfiguration
-from aioquic.quic.events import QuicEvent, StreamDataReceived
+from aioquic.quic.events import ConnectionTerminated, QuicEvent, StreamDataReceived
+
+from protocol import (decode_ranges, frame, new_hasher, set_socket_buffers,
+                      FRAME_START, FRAME_FIN, HASH_ALGOS,
+                      CHUNK_ACK, FILE_START_ACK, FILE_COMPLETE, ERROR)
 
 logger = logging.getLogger(__name__)
 
+# Credit-based flow control: at most SEND_WINDOW unacknowledged chunks per
+# stream; sending resumes once acks bring the count down to SEND_LOW_WATER
+SEND_WINDOW = 32
+SEND_LOW_WATER = SEND_WINDOW // 2
+ACK_TIMEOUT = 30.0
+
+# Chunks at least this large are hashed on a worker thread; smaller ones cost
+# less to handle inline than a thread hop
+THREAD_READ_MIN = 256 * 1024
+
+# Chunks queued with send_stream_data between transmit() calls, so aioquic can
+# pack them into full datagrams with fewer sendto syscalls
+TRANSMIT_BATCH = 16
+
+def _map_file(f):
+    """Map an open file read-only for sequential access; empty files can't be mapped"""
+    if not f.seek(0, 2):
+        return nullcontext(b"")
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
 class MultiStreamQuicFileClient(QuicConnectionProtocol):
     """QUIC protocol handler supporting multiple concurrent file transfers"""
     
@@ -27,77 +56,146 @@ class MultiStreamQuicFileClient(QuicConnectionProtocol):
         self.transfer_complete = {}
         self.transfer_errors = {}
         self.active_transfers = {}  # stream_id -> transfer info
-    
+        self.response_buffers = {}  # stream_id -> partial server message
+        self.inflight = {}  # stream_id -> chunks sent but not yet acknowledged
+        self.send_credit = {}  # stream_id -> Event set when the window reopens
+        self.start_acked = {}  # stream_id -> Event set on FILE_START_ACK
+        self.transfer_events = {}  # stream_id -> Event set on completion or error
+        self.connection_closed = False  # set once the connection terminates, e.g. on idle timeout
+
+    def connection_made(self, transport) -> None:
+        """Enlarge the socket's kernel buffers before any data is sent"""
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            set_socket_buffers(sock)
+        super().connection_made(transport)
+
     def quic_event_received(self, event: QuicEvent) -> None:
         """Handle QUIC events"""
         if isinstance(event, StreamDataReceived):
             self.handle_response(event.stream_id, event.data)
+        elif isinstance(event, ConnectionTerminated):
+            # No transfer still open on this connection can finish now
+            self.connection_closed = True
+            reason = event.reason_phrase or "QUIC connection closed"
+            for stream_id, complete in self.transfer_complete.items():
+                if not complete and stream_id not in self.transfer_errors:
+                    self.fail_transfer(stream_id, reason)
     
     def handle_response(self, stream_id: int, data: bytes) -> None:
-        """Handle server responses"""
+        """Split server data into newline-terminated messages"""
+        buffer = self.response_buffers.get(stream_id, b"") + data
+        *messages, self.response_buffers[stream_id] = buffer.split(b"\n")
+        for message in messages:
+            self.handle_message(stream_id, message)
+    
+    def handle_message(self, stream_id: int, data: bytes) -> None:
+        """Handle one server response"""
         try:
-            message = data.decode('utf-8')
-            
-            if message.startswith('FILE_START_ACK|'):
+            # Acks are by far the most frequent message, so test for them first
+            if data.startswith(CHUNK_ACK):
+                # One ack covers a batch of chunk id ranges
+                chunk_ids = decode_ranges(data[len(CHUNK_ACK):])
+                acked = self.chunk_acknowledgments.get(stream_id)
+                if acked is None:
+                    acked = self.chunk_acknowledgments[stream_id] = set()
+                acked.update(chunk_ids)
+                
+                # Return send credits; wake the sender at the low-water mark
+                inflight = self.inflight.get(stream_id)
+                if inflight is not None:
+                    inflight -= len(chunk_ids)
+                    self.inflight[stream_id] = inflight
+                    if inflight <= SEND_LOW_WATER:
+                        self.send_credit[stream_id].set()
+            elif data.startswith(FILE_START_ACK):
                 logger.info(f"Server acknowledged file start for stream {stream_id}")
-            elif message.startswith('CHUNK_ACK|'):
-                chunk_id = int(message.split('|')[1])
-                if stream_id not in self.chunk_acknowledgments:
-                    self.chunk_acknowledgments[stream_id] = set()
-                self.chunk_acknowledgments[stream_id].add(chunk_id)
-            elif message.startswith('FILE_COMPLETE|'):
-                parts = message.split('|')
-                filename = parts[1]
-                size = int(parts[2])
+                # The ack names the hash algorithm the server picked from our offer
+                transfer = self.active_transfers.get(stream_id)
+                if transfer is not None:
+                    hash_algo = data[len(FILE_START_ACK):].split(b'|', 1)[0]
+                    transfer['hash_algo'] = hash_algo.decode('ascii')
+                event = self.start_acked.get(stream_id)
+                if event is not None:
+                    event.set()
+            elif data.startswith(FILE_COMPLETE):
+                filename, size = data[len(FILE_COMPLETE):].rsplit(b'|', 1)
+                filename, size = filename.decode('utf-8'), int(size)
                 logger.info(f"File transfer completed: {filename} ({size} bytes) on stream {stream_id}")
                 self.transfer_complete[stream_id] = True
-            elif message.startswith('ERROR|'):
-                error_msg = message.split('|', 1)[1]
+                event = self.transfer_events.get(stream_id)
+                if event is not None:
+                    event.set()
+            elif data.startswith(ERROR):
+                error_msg = data[len(ERROR):].decode('utf-8', 'replace')
                 logger.error(f"Server error for stream {stream_id}: {error_msg}")
-                self.transfer_errors[stream_id] = error_msg
+                self.fail_transfer(stream_id, error_msg)
                 
         except Exception as e:
             logger.error(f"Error handling server response: {e}")
     
+    def fail_transfer(self, stream_id: int, error_msg: str) -> None:
+        """Record a transfer error and wake anything waiting on the stream"""
+        self.transfer_errors[stream_id] = error_msg
+        for events in (self.start_acked, self.send_credit, self.transfer_events):
+            event = events.get(stream_id)
+            if event is not None:
+                event.set()
+    
     async def send_file_async(
         self, 
         file_path: Path, 
         chunk_size: int = 64 * 1024,
-        progress_callback: Optional[Callable[[int, int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int, int], None]] = None,
+        file_hash: Optional[str] = None,
+        hash_algo: Optional[str] = None,
+        file_size: Optional[int] = None
     ) -> int:
-        """Start sending a file asynchronously, returns stream_id"""
+        """Start sending a file asynchronously, returns stream_id
         
-        if not file_path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
+        The file's hash is computed while the chunks are read for sending and
+        sent as a trailer, using whichever of HASH_ALGOS the server picks
+        (BLAKE3 when both ends have it, else SHA-256). A caller that already
+        knows the hex digest can pass it as file_hash to skip hashing
+        altogether; it is taken as SHA-256 unless hash_algo says otherwise.
+        Callers that have already stat'ed the file can pass file_size.
+        """
+        if self.connection_closed:
+            raise ConnectionError("QUIC connection is closed")
+        if hash_algo is not None:
+            hash_algos = hash_algo
+        else:
+            hash_algos = "sha256" if file_hash is not None else ",".join(HASH_ALGOS)
         
-        # Calculate file info
-        file_size = file_path.stat().st_size
+        # Calculate file info; stat raises FileNotFoundError for missing files
+        if file_size is None:
+            file_size = os.stat(file_path).st_size
         total_chunks = math.ceil(file_size / chunk_size)
         
-        # Calculate file hash
-        hasher = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                hasher.update(chunk)
-        file_hash = hasher.hexdigest()
-        
         # Create stream for this file transfer
         stream_id = self._quic.get_next_available_stream_id()
         
         # Initialize stream state
         self.chunk_acknowledgments[stream_id] = set()
         self.transfer_complete[stream_id] = False
+        self.inflight[stream_id] = 0
+        self.send_credit[stream_id] = asyncio.Event()
+        self.start_acked[stream_id] = asyncio.Event()
+        self.transfer_events[stream_id] = asyncio.Event()
         self.active_transfers[stream_id] = {
             'file_path': file_path,
             'total_chunks': total_chunks,
-            'file_size': file_size
+            'file_size': file_size,
+            'file_hash': file_hash,
+            'hash_algo': hash_algos.partition(',')[0]  # replaced by the server's pick
         }
         
         logger.info(f"Starting async transfer: {file_path.name} on stream {stream_id}")
         
-        # Send file metadata
-        metadata = f"FILE_START|{file_path.name}|{file_size}|{total_chunks}|{file_hash}\n"
-        self._quic.send_stream_data(stream_id, metadata.encode('utf-8'))
+        # Send file metadata, offering our hash algorithms; the hash follows
+        # the chunks as a trailer
+        metadata = f"{file_path.name}|{file_size}|{total_chunks}|{chunk_size}|{hash_algos}".encode('utf-8')
+        self._quic.send_stream_data(stream_id, frame(FRAME_START, 0, metadata))
         self.transmit()
         
         # Start sending chunks in background
@@ -114,59 +212,93 @@ class MultiStreamQuicFileClient(QuicConnectionProtocol):
     ):
         """Send file chunks for a specific stream"""
         try:
-            total_chunks = self.active_transfers[stream_id]['total_chunks']
+            transfer = self.active_transfers[stream_id]
+            total_chunks = transfer['total_chunks']
+            file_size = transfer['file_size']
+            file_hash = transfer['file_hash']
+            inflight = self.inflight
+            credit = self.send_credit[stream_id]
             
-            # Wait a bit for server acknowledgment
-            await asyncio.sleep(0.1)
+            # Wait for the server to accept the transfer and pick the hash
+            await asyncio.wait_for(self.start_acked[stream_id].wait(), ACK_TIMEOUT)
+            if stream_id in self.transfer_errors:
+                return
+            hasher = new_hasher(transfer['hash_algo']) if file_hash is None else None
             
-            # Send file chunks
-            with open(file_path, 'rb') as f:
+            # Chunks are views into a read-only mapping of the file; aioquic
+            # copies them into its send buffer, so no read() buffers are filled
+            # per chunk. They go out unframed: the server places file bytes by
+            # their stream offset
+            sent_chunks = 0
+            with open(file_path, 'rb') as f, _map_file(f) as mm, memoryview(mm) as view:
+                if len(view) < file_size:
+                    raise ValueError(f"{file_path.name} shrank after the transfer started")
                 for chunk_id in range(total_chunks):
-                    chunk_data = f.read(chunk_size)
-                    if not chunk_data:
-                        break
-                    
-                    # Send chunk with ID
-                    chunk_msg = b'CHUNK|' + str(chunk_id).encode('utf-8') + b'|' + chunk_data
-                    self._quic.send_stream_data(stream_id, chunk_msg)
-                    self.transmit()
+                    offset = chunk_id * chunk_size
+                    with view[offset:min(offset + chunk_size, file_size)] as chunk:
+                        n = len(chunk)
+                        if hasher:
+                            if n >= THREAD_READ_MIN:
+                                await asyncio.to_thread(hasher.update, chunk)
+                            else:
+                                hasher.update(chunk)
+                        
+                        # Send the chunk; flushed to the network in batches
+                        self._quic.send_stream_data(stream_id, chunk)
+                    sent_chunks += 1
+                    if (chunk_id + 1) % TRANSMIT_BATCH == 0:
+                        self.transmit()
                     
                     # Update progress (now includes stream_id)
                     if progress_callback:
                         progress_callback(stream_id, chunk_id + 1, total_chunks)
                     
-                    # Small delay
-                    await asyncio.sleep(0.01)
+                    # Window full: flush, then wait for acks to return credit
+                    in_window = inflight[stream_id] + 1
+                    inflight[stream_id] = in_window
+                    if in_window >= SEND_WINDOW:
+                        self.transmit()
+                        credit.clear()
+                        await asyncio.wait_for(credit.wait(), ACK_TIMEOUT)
+                        if stream_id in self.transfer_errors:
+                            return
             
-            # Close the stream
-            self._quic.send_stream_data(stream_id, b'', end_stream=True)
+            # Send the FIN trailer, which lets the server verify without
+            # waiting for the stream to close, then close the stream
+            if hasher:
+                file_hash = hasher.hexdigest()
+            fin = frame(FRAME_FIN, sent_chunks, file_hash.encode('ascii'))
+            self._quic.send_stream_data(stream_id, fin, end_stream=True)
             self.transmit()
             
             logger.info(f"All chunks sent for {file_path.name} on stream {stream_id}")
             
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out waiting for server acknowledgment on stream {stream_id}")
+            self.fail_transfer(stream_id, "Timed out waiting for server acknowledgment")
         except Exception as e:
             logger.error(f"Error sending chunks for stream {stream_id}: {e}")
-            self.transfer_errors[stream_id] = str(e)
+            self.fail_transfer(stream_id, str(e))
     
     async def wait_for_transfer(self, stream_id: int, timeout: int = 30) -> bool:
         """Wait for a specific transfer to complete"""
-        start_time = asyncio.get_event_loop().time()
+        event = self.transfer_events.get(stream_id)
+        if event is None:
+            logger.error(f"Unknown stream {stream_id}")
+            return False
         
-        while True:
-            current_time = asyncio.get_event_loop().time()
-            if current_time - start_time > timeout:
-                logger.error(f"Timeout waiting for stream {stream_id}")
-                return False
-            
-            if stream_id in self.transfer_errors:
-                logger.error(f"Transfer failed on stream {stream_id}: {self.transfer_errors[stream_id]}")
-                return False
-            
-            if self.transfer_complete.get(stream_id, False):
-                logger.info(f"Transfer completed successfully on stream {stream_id}")
-                return True
-            
-            await asyncio.sleep(0.1)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout waiting for stream {stream_id}")
+            return False
+        
+        if stream_id in self.transfer_errors:
+            logger.error(f"Transfer failed on stream {stream_id}: {self.transfer_errors[stream_id]}")
+            return False
+        
+        logger.info(f"Transfer completed successfully on stream {stream_id}")
+        return True
     
     async def wait_for_all_transfers(self, stream_ids: List[int], timeout: int = 60) -> bool:
         """Wait for all transfers to complete"""
@@ -192,6 +324,10 @@ async def send_multiple_files(
     )
     
     def progress_callback(stream_id: int, chunks_sent: int, total_chunks: int):
+        # Print about every 10% rather than on every chunk
+        step = max(1, total_chunks // 10)
+        if chunks_sent % step and chunks_sent != total_chunks:
+            return
         progress = (chunks_sent / total_chunks) * 100
         print(f"Stream {stream_id}: {progress:.1f}% ({chunks_sent}/{total_chunks} chunks)")
     
@@ -208,12 +344,14 @@ async def send_multiple_files(
             stream_ids = []
             for file_path in file_paths:
                 path = Path(file_path)
-                if path.exists():
-                    stream_id = await protocol.send_file_async(path, progress_callback=progress_callback)
-                    stream_ids.append(stream_id)
-                    print(f"Started transfer: {path.name} on stream {stream_id}")
-                else:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
                     print(f"File not found: {file_path}")
+                    continue
+                stream_id = await protocol.send_file_async(path, progress_callback=progress_callback, file_size=st.st_size)
+                stream_ids.append(stream_id)
+                print(f"Started transfer: {path.name} on stream {stream_id}")
             
             if not stream_ids:
                 print("No files to transfer")
@@ -249,4 +387,10 @@ async def main():
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
+    # libuv-backed event loop where available; the stock loop otherwise
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
@@ -7,107 +7,251 @@ Handles file transfers using QUIC protocol with chunking and parallel streams
 import asyncio
 import logging
 import hashlib
-from typing import Dict, Optional
-from dataclasses import dataclass
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field
 from pathlib import Path
 
-from aioquic.asyncio import serve
 from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.asyncio.server import QuicServer
 from aioquic.quic.configuration import QuicConfiguration
-from aioquic.quic.events import QuicEvent, StreamDataReceived
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("./logs/quic_server.log"),
-        logging.StreamHandler()
-    ])
+from aioquic.quic.events import ConnectionTerminated, QuicEvent, StreamDataReceived
+
+from protocol import (HDR, FRAME_START, FRAME_FIN, encode_ranges, new_hasher, pick_hash_algo, set_socket_buffers,
+                      CHUNK_ACK, FILE_START_ACK, FILE_COMPLETE, ERROR)
+
 logger = logging.getLogger(__name__)
 
+def setup_logging() -> QueueListener:
+    """Route log records through a queue to a listener thread, so file and console
+    writes never block the event loop; call once per process and stop() the result"""
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handlers = [logging.FileHandler("./logs/quic_server.log"), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.handlers = [QueueHandler(log_queue)]
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    return listener
+
+# Chunk acks are batched per stream: sent once ACK_BATCH chunks are pending,
+# otherwise after ACK_DELAY seconds
+ACK_BATCH = 16
+ACK_DELAY = 0.002
+
+# Per-connection limits: START frames beyond MAX_TRANSFERS open transfers are
+# refused with ERROR|BUSY, and transfers that receive nothing for
+# TRANSFER_IDLE_TIMEOUT seconds are dropped by a reaper that runs every
+# REAP_INTERVAL seconds, so stalled streams can't pin fds and buffers.
+# aioquic first lets a client open 128 bidirectional streams, so the cap
+# stays below that to be the limit a burst of uploads actually hits
+MAX_TRANSFERS = 64
+TRANSFER_IDLE_TIMEOUT = 60.0
+REAP_INTERVAL = 30.0
+
+HOST = "localhost"
+PORT = 4433
+# Server processes sharing PORT via SO_REUSEPORT; set to 1 for a single process
+WORKERS = int(os.environ.get("QUIC_SERVER_WORKERS", os.cpu_count() or 1))
+# Flow-control credit granted to clients; aioquic's 1 MiB defaults are shared
+# by every stream of a connection, so concurrent uploads starve each other
+# waiting for MAX_DATA updates long before the link is saturated
+MAX_STREAM_DATA = 16 * 1024 * 1024
+MAX_DATA = 64 * 1024 * 1024
+
+# File bytes arrive a packet's worth at a time; they are gathered per transfer
+# and written (and hashed) in batches of this size, so large files cost one
+# pwrite() per MiB rather than one per packet
+WRITE_BATCH = 1024 * 1024
+# Idle WRITE_BATCH-sized buffers kept for reuse by later transfers
+WRITE_BUFFER_POOL = 16
+_write_buffers: List[bytearray] = []
+# Batches are written and hashed here, off the event loop; OpenSSL and BLAKE3
+# release the GIL while hashing, so this overlaps with packet processing
+_io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="quic-io")
+
+# Sequence numbers for partial-file names; with the pid they keep concurrent
+# transfers of one filename, across connections and workers, apart
+_part_ids = itertools.count()
+
+CERT_FILE = "./certs/cert.pem"
+KEY_FILE = "./certs/key.pem"
+
+@lru_cache(maxsize=None)
+def load_tls_credentials(certfile: str, keyfile: str):
+    """Read and parse the PEM certificate chain and key once per process"""
+    parsed = QuicConfiguration(is_client=False)
+    parsed.load_cert_chain(certfile, keyfile)
+    return parsed.certificate, parsed.certificate_chain, parsed.private_key
+
 @dataclass
 class FileTransfer:
     filename: str
     total_size: int
     total_chunks: int
-    received_chunks: Dict[int, bytes]
+    chunk_size: int
+    file_path: Path  # final name, only replaced once the file is verified
+    part_path: Path  # hidden file the bytes are received into
+    fd: int  # open on part_path; file bytes are pwrite()n here at their stream offset
+    bytes_received: int = 0  # stream offset of the next file byte
+    # Pooled buffer of file bytes not yet written; its first `buffered` bytes
+    # belong at offset bytes_received - buffered
+    write_buffer: Optional[bytearray] = None
+    buffered: int = 0
+    # The most recent batch handed to the I/O pool, starting with the file's
+    # preallocation; each batch waits for the one before it, so writes and
+    # hash updates stay in order
+    flushing: Optional[asyncio.Future] = None
+    # First failure of the preallocation or a batch; later batches are skipped
+    # and seal_file raises it
+    write_error: Optional[Exception] = None
     file_hash: Optional[str] = None
-    buffer: bytes = b""
+    hash_algo: str = "sha256"
+    # QUIC delivers stream bytes in order, so the hash is built as they land
+    hasher: object = field(default_factory=hashlib.sha256)
+    # Started by the last byte: syncs the file and resolves to its digest
+    sealing: Optional[asyncio.Future] = None
+    last_activity: float = 0.0  # loop time of the last START or file bytes
+
+    @property
+    def chunks_received(self) -> int:
+        """Whole chunks received so far; the short last chunk counts once complete"""
+        if self.bytes_received == self.total_size:
+            return self.total_chunks
+        return self.bytes_received // self.chunk_size
+
+def _acquire_write_buffer() -> bytearray:
+    return _write_buffers.pop() if _write_buffers else bytearray(WRITE_BATCH)
+
+def _return_write_buffer(buf: bytearray) -> None:
+    if len(_write_buffers) < WRITE_BUFFER_POOL:
+        _write_buffers.append(buf)
+
+def _release_write_buffer(transfer: "FileTransfer") -> None:
+    buf = transfer.write_buffer
+    if buf is not None:
+        transfer.write_buffer = None
+        _return_write_buffer(buf)
+
+def _write_and_hash(fd: int, hasher, buf: bytearray, size: int, offset: int) -> None:
+    """Write the first size bytes of buf at offset and feed them to hasher"""
+    with memoryview(buf) as view, view[:size] as data:
+        os.pwrite(fd, data, offset)
+        hasher.update(data)
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserve a file's full size up front so offset writes don't fragment it"""
+    if size:
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except (AttributeError, OSError):
+            pass  # Not supported by this platform or filesystem
+    os.ftruncate(fd, size)
+
+def _sync_and_close(fd: int) -> None:
+    """Flush a received file to disk and close it"""
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 class QuicFileServerProtocol(QuicConnectionProtocol):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.active_transfers: Dict[int, FileTransfer] = {}
-        self.stream_buffers: Dict[int, bytes] = {}  # stream_id -> buffered data
+        self.stream_buffers: Dict[int, bytearray] = {}  # stream_id -> unparsed frame bytes
+        self.pending_acks: Dict[int, List[int]] = {}  # stream_id -> chunk ids not yet acked
+        self._ack_flush_handle: Optional[asyncio.TimerHandle] = None
+        self._transmit_handle: Optional[asyncio.Handle] = None
+        self._reap_handle: Optional[asyncio.TimerHandle] = None
         self.upload_dir = Path("uploads")
         self.upload_dir.mkdir(exist_ok=True)
 
     def quic_event_received(self, event: QuicEvent) -> None:
         if isinstance(event, StreamDataReceived):
             self.handle_stream_data(event.stream_id, event.data, event.end_stream)
+        elif isinstance(event, ConnectionTerminated):
+            # Nothing left to ack on a closed connection, and nothing more will
+            # arrive for its open transfers
+            if self._ack_flush_handle is not None:
+                self._ack_flush_handle.cancel()
+                self._ack_flush_handle = None
+            if self._reap_handle is not None:
+                self._reap_handle.cancel()
+                self._reap_handle = None
+            for stream_id in list(self.active_transfers):
+                self.discard_transfer(stream_id)
+            self.pending_acks.clear()
 
     def handle_stream_data(self, stream_id: int, data: bytes, end_stream: bool) -> None:
         try:
-            buffer = self.stream_buffers.get(stream_id, b"") + data
-            self.stream_buffers[stream_id] = buffer
-
-            while b"|" in buffer:
-                if buffer.startswith(b"FILE_START|"):
-                    try:
-                        terminator = buffer.find(b"\n")
-                        if terminator == -1:
-                            return  # Wait for complete message
-                        message = buffer[:terminator].decode("utf-8")
-                        buffer = buffer[terminator + 1:]
-                        self.stream_buffers[stream_id] = buffer
-
-                        parts = message.split("|")
-                        if len(parts) != 5:
-                            raise ValueError("Invalid FILE_START format")
-
-                        _, filename, size, total_chunks, file_hash = parts
-                        self.active_transfers[stream_id] = FileTransfer(
-                            filename=filename,
-                            total_size=int(size),
-                            total_chunks=int(total_chunks),
-                            received_chunks={},
-                            file_hash=file_hash,
-                            buffer=b""
-                        )
-                        logger.info(f"Started file transfer: {filename} ({size} bytes, {total_chunks} chunks)")
-                        ack = f"FILE_START_ACK|{filename}".encode("utf-8")
-                        self._quic.send_stream_data(stream_id, ack)
-                        self.transmit()
-                    except Exception as e:
-                        logger.error(f"FILE_START error: {e}")
-                        self.send_error_response(stream_id, str(e))
-                        return
-                elif buffer.startswith(b"CHUNK|"):
-                    parts = buffer.split(b"|", 2)
-                    if len(parts) < 3:
-                        return  # Wait for more data
-                    chunk_id_str = parts[1].decode("utf-8")
-                    try:
-                        chunk_id = int(chunk_id_str)
-                    except ValueError:
-                        self.send_error_response(stream_id, "Invalid CHUNK ID")
-                        return
-                    chunk_data = parts[2]
-
-                    if stream_id in self.active_transfers:
-                        self.active_transfers[stream_id].received_chunks[chunk_id] = chunk_data
-                        del self.stream_buffers[stream_id]
+            # Only a partial trailing frame is ever buffered; data that starts
+            # on a frame boundary is parsed in place without being copied
+            buffer = self.stream_buffers.pop(stream_id, None)
+            if buffer:
+                buffer += data
+                data = buffer
 
-                        logger.info(f"Received chunk {chunk_id} on stream {stream_id} ({len(self.active_transfers[stream_id].received_chunks)}/{self.active_transfers[stream_id].total_chunks})")
+            # After FILE_START the next total_size bytes are raw file data,
+            # written at their stream offset; only control frames are parsed.
+            # Slices are memoryviews, so file bytes are not copied before they
+            # reach the file; the views are released before the buffer is resized
+            offset = 0
+            with memoryview(data) as view:
+                while offset < len(data):
+                    transfer = self.active_transfers.get(stream_id)
+                    if transfer is not None and transfer.bytes_received < transfer.total_size:
+                        end = min(len(data), offset + transfer.total_size - transfer.bytes_received)
+                        with view[offset:end] as file_data:
+                            self.handle_file_data(stream_id, transfer, file_data)
+                        offset = end
+                        continue
 
-                        ack = f"CHUNK_ACK|{chunk_id}".encode("utf-8")
-                        self._quic.send_stream_data(stream_id, ack)
-                        self.transmit()
-                    else:
-                        logger.warning(f"Chunk received for unknown stream {stream_id}")
-                        self.send_error_response(stream_id, f"No active transfer found for stream {stream_id}")
+                    if len(data) - offset < HDR.size:
+                        break  # Wait for the rest of the header
+                    frame_type, frame_id, length = HDR.unpack_from(data, offset)
+                    end = offset + HDR.size + length
+                    if len(data) < end:
+                        break  # Wait for the rest of the frame
+                    with view[offset + HDR.size:end] as payload:
+                        ok = self.handle_frame(stream_id, frame_type, frame_id, payload)
+                    offset = end
+                    if not ok:
+                        self.discard_transfer(stream_id)
                         return
+
+            # Keep the unconsumed remainder for the next event
+            if offset < len(data):
+                if data is buffer:
+                    del buffer[:offset]
                 else:
-                    break  # Wait for more data
+                    buffer = bytearray(data[offset:])
+                self.stream_buffers[stream_id] = buffer
+
+            # Ack a full batch now, or leave it for the flush timer
+            pending = self.pending_acks.get(stream_id)
+            if pending:
+                if len(pending) >= ACK_BATCH:
+                    self.send_acks(stream_id)
+                elif self._ack_flush_handle is None:
+                    self._ack_flush_handle = self._loop.call_later(ACK_DELAY, self.flush_acks)
+
+            # No transmit() here: aioquic transmits once after handing over
+            # all events from a datagram, which covers everything queued above
 
             if end_stream:
                 logger.info(f"Stream {stream_id} ended")
@@ -116,65 +260,348 @@ class QuicFileServerProtocol(QuicConnectionProtocol):
         except Exception as e:
             logger.error(f"Failed to handle stream data: {e}")
             self.send_error_response(stream_id, str(e))
+            self.discard_transfer(stream_id)
 
-    def handle_stream_end(self, stream_id: int) -> None:
-        if stream_id in self.active_transfers:
-            transfer = self.active_transfers[stream_id]
-            total_received = len(transfer.received_chunks)
-            if total_received == transfer.total_chunks:
-                try:
-                    file_path = self.upload_dir / transfer.filename
-                    with open(file_path, 'wb') as f:
-                        for chunk_id in sorted(transfer.received_chunks):
-                            f.write(transfer.received_chunks[chunk_id])
-
-                    # Verify file size
-                    actual_size = file_path.stat().st_size
-                    if actual_size != transfer.total_size:
-                        raise ValueError("File size mismatch")
-
-                    # Verify hash
-                    if transfer.file_hash:
-                        with open(file_path, 'rb') as f:
-                            file_hash = hashlib.sha256(f.read()).hexdigest()
-                        if file_hash != transfer.file_hash:
-                            raise ValueError("Hash verification failed")
-
-                    logger.info(f"File {transfer.filename} saved successfully ({actual_size} bytes)")
-                    complete = f"FILE_COMPLETE|{transfer.filename}|{actual_size}".encode("utf-8")
-                    self._quic.send_stream_data(stream_id, complete)
-                    self.transmit()
-                except Exception as e:
-                    logger.error(f"Error saving file: {e}")
-                    self.send_error_response(stream_id, str(e))
+    def handle_frame(self, stream_id: int, frame_type: int, frame_id: int, payload: memoryview) -> bool:
+        """Dispatch one frame; handlers must not keep a reference to payload"""
+        if frame_type == FRAME_START:
+            return self.handle_file_start(stream_id, payload)
+        if frame_type == FRAME_FIN:
+            return self.handle_fin(stream_id, frame_id, payload)
+        self.send_error_response(stream_id, f"Unknown frame type {frame_type}")
+        return False
+
+    def handle_file_start(self, stream_id: int, payload: memoryview) -> bool:
+        try:
+            # Split from the right so a "|" in the filename survives; only the
+            # text fields are decoded, the numbers are parsed from bytes
+            parts = bytes(payload).rsplit(b"|", 4)
+            if len(parts) != 5:
+                raise ValueError("Invalid FILE_START format")
+
+            if len(self.active_transfers) >= MAX_TRANSFERS:
+                logger.warning(f"Refusing transfer on stream {stream_id}: {MAX_TRANSFERS} already open")
+                self.send_error_response(stream_id, "BUSY")
+                return False
+
+            raw_name, size, total_chunks, chunk_size, hash_algos = parts
+            filename, hash_algo = raw_name.decode("utf-8"), pick_hash_algo(hash_algos.decode("ascii"))
+            total_size, total_chunks = int(size), int(total_chunks)
+            hasher = new_hasher(hash_algo)
+
+            # Receive into a hidden partial file that replaces file_path only
+            # once verified, so a failed transfer never touches an existing file
+            # and concurrent transfers of one name never share an inode.
+            # Pre-size it; data is written at its stream offset. Reserving
+            # a large file can take a while, so it runs on the I/O pool ahead of
+            # the first batch, which waits for it; a failure surfaces at sealing
+            file_path = self.upload_dir / filename
+            part_path = self.upload_dir / f".{filename}.{os.getpid()}.{next(_part_ids)}.part"
+            fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            preallocating = self._loop.run_in_executor(_io_executor, _preallocate, fd, total_size)
+            self.active_transfers[stream_id] = FileTransfer(
+                filename=filename,
+                total_size=total_size,
+                total_chunks=total_chunks,
+                chunk_size=int(chunk_size),
+                file_path=file_path,
+                part_path=part_path,
+                fd=fd,
+                hash_algo=hash_algo,
+                hasher=hasher,
+                flushing=preallocating,
+                last_activity=self._loop.time()
+            )
+            if self._reap_handle is None:
+                self._reap_handle = self._loop.call_later(REAP_INTERVAL, self.reap_idle_transfers)
+            logger.info(f"Started file transfer: {filename} ({total_size} bytes, {total_chunks} chunks)")
+            ack = FILE_START_ACK + hash_algo.encode("ascii") + b"|" + raw_name + b"\n"
+            self._quic.send_stream_data(stream_id, ack)
+            return True
+        except Exception as e:
+            logger.error(f"FILE_START error: {e}")
+            self.send_error_response(stream_id, str(e))
+            return False
+
+    def handle_file_data(self, stream_id: int, transfer: FileTransfer, data: memoryview) -> None:
+        """Buffer file bytes for writing and ack the chunks they complete"""
+        transfer.last_activity = self._loop.time()
+        done_before = transfer.chunks_received
+
+        # Copy into the fixed-size buffer in place; it is never resized, and a
+        # full one is handed off and replaced
+        pos, size = 0, len(data)
+        while pos < size:
+            buf = transfer.write_buffer
+            if buf is None:
+                buf = transfer.write_buffer = _acquire_write_buffer()
+            start = transfer.buffered
+            take = min(size - pos, WRITE_BATCH - start)
+            buf[start:start + take] = data if take == size else data[pos:pos + take]
+            transfer.buffered += take
+            transfer.bytes_received += take
+            pos += take
+            if transfer.buffered == WRITE_BATCH:
+                self.write_pending(transfer)
+        if transfer.bytes_received == transfer.total_size:
+            self.write_pending(transfer)
+            _release_write_buffer(transfer)
+        done = transfer.chunks_received
+
+        # Chunk acks still drive the client's send window and progress
+        if done > done_before:
+            self.pending_acks.setdefault(stream_id, []).extend(range(done_before, done))
+            # Per-chunk detail only at DEBUG, and only formatted when it will be emitted
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received %d/%d chunks on stream %d", done, transfer.total_chunks, stream_id)
+
+        # Everything has landed: finalize now rather than when the trailer or
+        # the stream's FIN shows up
+        if transfer.bytes_received == transfer.total_size:
+            transfer.sealing = asyncio.ensure_future(self.seal_file(transfer))
+
+    def write_pending(self, transfer: FileTransfer) -> None:
+        """Hand the buffered file bytes to the I/O pool; the next bytes get a fresh buffer"""
+        if transfer.buffered:
+            buf, size = transfer.write_buffer, transfer.buffered
+            transfer.write_buffer, transfer.buffered = None, 0
+            if transfer.write_error is not None:
+                _return_write_buffer(buf)  # The transfer already failed at an earlier batch
+                return
+            transfer.flushing = asyncio.ensure_future(self.flush_batch(
+                transfer, transfer.flushing, buf, size, transfer.bytes_received - size))
+
+    async def flush_batch(self, transfer: FileTransfer, previous: Optional[asyncio.Future],
+                          buf: bytearray, size: int, offset: int) -> None:
+        """Write and hash one batch on the I/O pool once the batch before it is done
+
+        A failure is recorded in transfer.write_error rather than raised, so the
+        batches queued behind it are skipped instead of each failing with it again
+        """
+        try:
+            if previous is not None:
+                await previous
+            if transfer.write_error is None:
+                await self._loop.run_in_executor(
+                    _io_executor, _write_and_hash, transfer.fd, transfer.hasher, buf, size, offset)
+        except Exception as e:
+            if transfer.write_error is None:
+                logger.error(f"Failed to write {transfer.filename}: {e}")
+                transfer.write_error = e
+        finally:
+            _return_write_buffer(buf)
+
+    def send_acks(self, stream_id: int) -> None:
+        """Queue one CHUNK_ACK covering every pending chunk on a stream"""
+        chunk_ids = self.pending_acks.pop(stream_id, None)
+        if chunk_ids:
+            ack = CHUNK_ACK + encode_ranges(chunk_ids) + b"\n"
+            self._quic.send_stream_data(stream_id, ack)
+
+    def flush_acks(self) -> None:
+        """Timer callback: ack whatever is pending on every stream"""
+        self._ack_flush_handle = None
+        for stream_id in list(self.pending_acks):
+            self.send_acks(stream_id)
+        self.transmit()
+
+    def handle_fin(self, stream_id: int, sent_chunks: int, payload: memoryview) -> bool:
+        """Start verification as soon as the trailer lands, ahead of the stream's FIN"""
+        transfer = self.active_transfers.get(stream_id)
+        if transfer is None:
+            return True
+        if sent_chunks != transfer.total_chunks:
+            self.send_error_response(stream_id, f"Client sent {sent_chunks}/{transfer.total_chunks} chunks")
+            return False
+        transfer.file_hash = str(payload, "ascii")
+        self.handle_stream_end(stream_id)
+        return True
+
+    def reap_idle_transfers(self) -> None:
+        """Timer callback: drop transfers that have stalled, then re-arm while any are open"""
+        self._reap_handle = None
+        deadline = self._loop.time() - TRANSFER_IDLE_TIMEOUT
+        stalled = [stream_id for stream_id, transfer in self.active_transfers.items()
+                   if transfer.last_activity < deadline]
+        for stream_id in stalled:
+            logger.warning(f"Dropping idle transfer {self.active_transfers[stream_id].filename} on stream {stream_id}")
+            self.send_error_response(stream_id, f"Transfer idle for over {TRANSFER_IDLE_TIMEOUT:.0f}s")
+            self.discard_transfer(stream_id)
+        if stalled:
+            self.transmit()
+        if self.active_transfers:
+            self._reap_handle = self._loop.call_later(REAP_INTERVAL, self.reap_idle_transfers)
+
+    def discard_transfer(self, stream_id: int) -> None:
+        """Drop a failed transfer's state and partial file"""
+        transfer = self.active_transfers.pop(stream_id, None)
+        if transfer is not None:
+            _release_write_buffer(transfer)
+            busy = transfer.sealing or transfer.flushing
+            if busy is None:
+                os.close(transfer.fd)
+                transfer.part_path.unlink(missing_ok=True)
             else:
-                self.send_error_response(stream_id, f"Incomplete transfer. Received {total_received}/{transfer.total_chunks} chunks.")
-            del self.active_transfers[stream_id]
-            self.stream_buffers.pop(stream_id, None)
+                # Queued batches still use the fd (and sealing closes it);
+                # clean up once they are done
+                def discard_when_idle(task: asyncio.Future) -> None:
+                    if not task.cancelled():
+                        task.exception()  # The transfer already failed; don't report twice
+                    if transfer.sealing is None:
+                        os.close(transfer.fd)
+                    transfer.part_path.unlink(missing_ok=True)
+                busy.add_done_callback(discard_when_idle)
+        self.stream_buffers.pop(stream_id, None)
+        self.pending_acks.pop(stream_id, None)
+
+    def handle_stream_end(self, stream_id: int) -> None:
+        self.send_acks(stream_id)
+        transfer = self.active_transfers.pop(stream_id, None)
+        self.stream_buffers.pop(stream_id, None)
+        if transfer is not None:
+            asyncio.ensure_future(self.finish_transfer(stream_id, transfer))
+
+    async def finish_transfer(self, stream_id: int, transfer: FileTransfer) -> None:
+        """Verify a fully received file and report the result to the client"""
+        saved = False
+        if transfer.bytes_received == transfer.total_size:
+            try:
+                # Usually already started, or even finished, by the last byte
+                file_hash = await (transfer.sealing or self.seal_file(transfer))
+
+                # Verify hash
+                if transfer.file_hash and file_hash != transfer.file_hash:
+                    raise ValueError("Hash verification failed")
+                
+                # Verified and synced: publish it under its real name
+                await asyncio.to_thread(os.replace, transfer.part_path, transfer.file_path)
+
+                logger.info(f"File {transfer.filename} saved successfully ({transfer.bytes_received} bytes)")
+                complete = b"%s%s|%d\n" % (FILE_COMPLETE, transfer.filename.encode("utf-8"), transfer.bytes_received)
+                self._quic.send_stream_data(stream_id, complete)
+                saved = True
+            except Exception as e:
+                logger.error(f"Error saving file: {e}")
+                self.send_error_response(stream_id, str(e))
+        else:
+            _release_write_buffer(transfer)
+            if transfer.flushing is not None:
+                await asyncio.wait([transfer.flushing])  # Let queued writes finish with the fd
+            os.close(transfer.fd)
+            self.send_error_response(stream_id, f"Incomplete transfer. Received {transfer.bytes_received}/{transfer.total_size} bytes.")
+        if not saved:
+            transfer.part_path.unlink(missing_ok=True)
+        # This runs outside event handling, so nothing else will flush it
+        self.transmit_soon()
+
+    async def seal_file(self, transfer: FileTransfer) -> str:
+        """Make a fully received partial file durable and return its digest;
+        finish_transfer renames it into place once the digest checks out"""
+        # Data was written in place, so once the last batch is out all that is
+        # left is to sync the file
+        try:
+            if transfer.flushing is not None:
+                await transfer.flushing
+        finally:
+            await asyncio.to_thread(_sync_and_close, transfer.fd)
+        if transfer.write_error is not None:
+            raise transfer.write_error
+        return transfer.hasher.hexdigest()
+
+    def transmit_soon(self) -> None:
+        """Coalesce sends queued outside event handling into one transmit per loop pass"""
+        if self._transmit_handle is None:
+            self._transmit_handle = self._loop.call_soon(self._transmit_now)
+
+    def _transmit_now(self) -> None:
+        self._transmit_handle = None
+        self.transmit()
 
     def send_error_response(self, stream_id: int, error_msg: str) -> None:
-        response = f"ERROR|{error_msg}".encode("utf-8")
+        """Queue an error; it goes out with the caller's next transmit"""
+        response = ERROR + error_msg.encode("utf-8") + b"\n"
         self._quic.send_stream_data(stream_id, response)
-        self.transmit()
 
-async def main():
+def make_configuration() -> QuicConfiguration:
     configuration = QuicConfiguration(
         alpn_protocols=["file-transfer"],
         is_client=False,
         max_datagram_frame_size=65536,
+        max_data=MAX_DATA,
+        max_stream_data=MAX_STREAM_DATA,
     )
-    configuration.load_cert_chain("./certs/cert.pem", "./certs/key.pem")
-    logger.info("Starting QUIC file transfer server on localhost:4433")
-    await serve(
-        host="localhost",
-        port=4433,
-        configuration=configuration,
-        create_protocol=QuicFileServerProtocol,
+    (configuration.certificate,
+     configuration.certificate_chain,
+     configuration.private_key) = load_tls_credentials(CERT_FILE, KEY_FILE)
+    return configuration
+
+def _bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    """UDP socket with enlarged buffers, bound with SO_REUSEPORT when several
+    workers share the port"""
+    family, _, _, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    set_socket_buffers(sock)
+    sock.bind(addr)
+    return sock
+
+async def serve_worker(configuration: QuicConfiguration, reuse_port: bool) -> None:
+    loop = asyncio.get_running_loop()
+    logger.info(f"Starting QUIC file transfer server on {HOST}:{PORT} "
+                f"(pid {os.getpid()}, {type(loop).__module__}.{type(loop).__name__})")
+    await loop.create_datagram_endpoint(
+        lambda: QuicServer(configuration=configuration, create_protocol=QuicFileServerProtocol),
+        sock=_bind_socket(HOST, PORT, reuse_port),
     )
     await asyncio.Event().wait()
 
+def run_worker(configuration: QuicConfiguration, reuse_port: bool = False) -> None:
+    # Listener threads don't survive fork(), so each worker starts its own
+    listener = setup_logging()
+    try:
+        asyncio.run(serve_worker(configuration, reuse_port))
+    except KeyboardInterrupt:
+        logger.info("Server stopped")
+    finally:
+        listener.stop()
+
+def main():
+    # Certificates are parsed once here and inherited by forked workers
+    configuration = make_configuration()
+    # The kernel only load-balances a shared UDP port across sockets on Linux
+    workers = WORKERS if sys.platform.startswith("linux") else 1
+    if workers <= 1:
+        run_worker(configuration)
+        return
+
+    # Each worker runs its own loop on its own socket; the kernel hashes every
+    # client's 4-tuple to one of them, so connections never span workers
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=run_worker, args=(configuration, True), daemon=True)
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    listener = setup_logging()
+    logger.info(f"Started {workers} server workers")
+    # Take the workers down with the parent, whichever way it is stopped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for proc in procs:
+            proc.join()
+    finally:
+        for proc in procs:
+            proc.terminate()
+        listener.stop()
+
 if __name__ == "__main__":
+    # libuv-backed event loop where available; the stock loop otherwise
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
-        logger.info("Server stopped")
\ No newline at end of file
+        pass
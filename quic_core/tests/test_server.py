@@ -0,0 +1,123 @@
+"""
+Tests for the QUIC file transfer server, over a loopback connection
+"""
+
+import asyncio
+import datetime
+import os
+
+import pytest
+from aioquic.asyncio import connect
+from aioquic.asyncio.server import QuicServer
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+import server
+from client import MultiStreamQuicFileClient
+from protocol import FRAME_START, frame
+
+
+def write_self_signed_cert(cert_file, key_file) -> None:
+    """Write a throwaway self-signed certificate and key for localhost"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_file.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ))
+
+
+@pytest.fixture
+def server_config(tmp_path, monkeypatch):
+    """Server configuration with a fresh certificate; uploads land in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    cert_file, key_file = tmp_path / "cert.pem", tmp_path / "key.pem"
+    write_self_signed_cert(cert_file, key_file)
+    monkeypatch.setattr(server, "CERT_FILE", str(cert_file))
+    monkeypatch.setattr(server, "KEY_FILE", str(key_file))
+    return server.make_configuration()
+
+
+@pytest.mark.asyncio
+async def test_transfers_beyond_cap_are_refused_busy(server_config):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: QuicServer(configuration=server_config, create_protocol=server.QuicFileServerProtocol),
+        local_addr=("127.0.0.1", 0),
+    )
+    port = transport.get_extra_info("sockname")[1]
+    try:
+        client_config = QuicConfiguration(alpn_protocols=["file-transfer"], is_client=True, verify_mode=False)
+        async with connect("127.0.0.1", port, configuration=client_config,
+                           create_protocol=MultiStreamQuicFileClient) as client:
+            # Open one more transfer than the cap, none of which send any data
+            stream_ids = []
+            for i in range(server.MAX_TRANSFERS + 1):
+                stream_id = client._quic.get_next_available_stream_id()
+                client.start_acked[stream_id] = asyncio.Event()
+                metadata = f"file{i}.bin|10|1|10|sha256".encode()
+                client._quic.send_stream_data(stream_id, frame(FRAME_START, 0, metadata))
+                stream_ids.append(stream_id)
+            client.transmit()
+
+            # Every START is answered, with an ack or an error
+            await asyncio.wait_for(
+                asyncio.gather(*(client.start_acked[sid].wait() for sid in stream_ids)), 10)
+
+            # Packets may carry the STARTs in any order, so which one is
+            # refused varies; exactly one must be
+            assert list(client.transfer_errors.values()) == ["BUSY"]
+    finally:
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_skips_later_batches(server_config, tmp_path, monkeypatch):
+    writes = []
+
+    def failing_write(*args):
+        writes.append(args)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(server, "_write_and_hash", failing_write)
+    protocol = server.QuicFileServerProtocol(QuicConnection(
+        configuration=server_config, original_destination_connection_id=os.urandom(8)))
+    part_path = tmp_path / ".big.bin.part"
+    transfer = server.FileTransfer(
+        filename="big.bin",
+        total_size=3 * server.WRITE_BATCH,
+        total_chunks=3,
+        chunk_size=server.WRITE_BATCH,
+        file_path=tmp_path / "big.bin",
+        part_path=part_path,
+        fd=os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644),
+    )
+
+    # Three batches are queued before the first one fails
+    for _ in range(3):
+        transfer.write_buffer = bytearray(server.WRITE_BATCH)
+        transfer.buffered = server.WRITE_BATCH
+        transfer.bytes_received += server.WRITE_BATCH
+        protocol.write_pending(transfer)
+
+    with pytest.raises(OSError, match="disk full"):
+        await protocol.seal_file(transfer)
+    assert len(writes) == 1
+    assert isinstance(transfer.write_error, OSError)